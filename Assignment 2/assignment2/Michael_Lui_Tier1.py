@@ -1,118 +1,57 @@
-import csv
-import os
-import sys
-import math
-
-
-# Define directories
-# control_dir = 'control_files'
-# treatment_dir = 'treatment_files'
-try: 
-    control_dir = sys.argv[1]
-    treatment_dir = sys.argv[2]
-except: 
-    print("Please provide the control and treatment directories as arguments.")
-    sys.exit(1)
-
-# Function to read and normalize gene expression data from CSV files
-def read_and_normalize_data(directory):
-    data = {}
-    
-    # First pass to calculate the total expression for all genes in each file
-    for file in os.listdir(directory):
-        if file.endswith('.csv'):
-            print(f"Processing file: {file} ({directory})")  # Debugging statement
-            
-            # Variable to track total expression for all genes in the current file
-            total_expression_in_file = 0
-            file_data = []  # Temporary storage for gene data before normalizing
-            
-            with open(os.path.join(directory, file), mode='r') as f:
-                reader = csv.reader(f)
-                next(reader)  # Skip header row
-
-                for row in reader:
-                    if not row:  # Skip empty rows
-                        continue
-                    gene_id = row[0]  # Gene ID is in the first column
-                    expression = float(row[1])  # Expression level is in the second column
-                    
-                    # Add to the total expression across all genes in the file
-                    total_expression_in_file += expression
-                    file_data.append((gene_id, expression))
-                    
-            # Now normalize each gene expression using the total expression from this file
-            for gene_id, expression in file_data:
-                normalized_expression = expression / total_expression_in_file
-                
-                # Add to data dictionary, aggregating by gene_id across files
-                if gene_id not in data:
-                    data[gene_id] = {'sum': 0, 'expressions': []}
-                
-                data[gene_id]['sum'] += normalized_expression
-                data[gene_id]['expressions'].append(normalized_expression)
-
-    # After processing all files, calculate the mean and median normalized expressions
+import argparse
+import numpy as np
+from expression_api import compare, summary_rows, export_tsv_rows, log_fold_change as calculate_log_fold_change
+from expression_matrix import load_normalized_matrices, summarize_expression
+from expression_cache import ExpressionFileCache
+from expression_summary import build_summary_table, write_summary, read_summary, compare_summaries
+
+
+# Function to parse the command line (kept out of import time so the module can be imported as a library)
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Normalize gene expression and compute log2 fold changes.")
+    parser.add_argument('control_dir', help="Directory of control experiment CSV files")
+    parser.add_argument('treatment_dir', help="Directory of treatment experiment CSV files")
+    parser.add_argument('--output', default='output_Tier1.txt', help="Tab-delimited output file")
+    # Number of worker processes used to parse the CSV files
+    parser.add_argument('--workers', type=int, default=1)
+    # On-disk cache of normalized per-file vectors; re-runs only parse new or changed files
+    parser.add_argument('--cache', default=None)
+    # Bounded-memory streaming mode with approximate medians (relative error)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--median-error', type=float, default=0.01)
+    # Binary summary (.npy) written next to the TSV, and validation of the written output
+    parser.add_argument('--summary', default=None)
+    parser.add_argument('--validate', action='store_true')
+    args = parser.parse_args(argv)
+    if args.stream and args.cache:
+        parser.error("--cache is not used with --stream, which reads every file once.")
+    return args
+
+# Function to compute per-gene summaries from a normalized genes x samples matrix
+def summarize_matrix(gene_ids, matrix):
+    means, medians = summarize_expression(matrix)
+    return summary_dict(gene_ids, means, medians)
+
+# Function to turn per-gene mean and median arrays into the summary dictionary
+def summary_dict(gene_ids, means, medians):
     normalized_data = {}
-    for gene_id, info in data.items():
-        # Calculate mean
-        mean = sum(info['expressions']) / len(info['expressions'])
-        
-        # Calculate median
-        sorted_expressions = sorted(info['expressions'])
-        n = len(sorted_expressions)
-        median = (sorted_expressions[n // 2] if n % 2 != 0 
-                  else (sorted_expressions[n // 2 - 1] + sorted_expressions[n // 2]) / 2)
-        
+    for gene_id, mean, median in zip(gene_ids, means.tolist(), medians.tolist()):
         normalized_data[gene_id] = {
             'mean': mean,
             'median': median
         }
-    
-    return normalized_data
 
-# Function to check calculated values
-def validate_output(file_path, control_data, treatment_data):
-    with open(file_path, mode='r') as f:
-        reader = csv.reader(f, delimiter='\t')
-        header = next(reader)  # Skip header
-        
-        for row in reader:
-            gene_id = row[0]
-            mean_control = float(row[1])
-            median_control = float(row[2])
-            mean_treatment = float(row[3])
-            median_treatment = float(row[4])
-            log_fold_change = float(row[5])
-
-            # Perform validations
-            if gene_id in control_data and gene_id in treatment_data:
-                # Validate means and medians
-                expected_mean_control = control_data[gene_id]['mean']
-                expected_mean_treatment = treatment_data[gene_id]['mean']
-                
-                if not (math.isclose(mean_control, expected_mean_control) and 
-                        math.isclose(mean_treatment, expected_mean_treatment)):
-                    print(f"Mismatch in means for {gene_id}: expected control {expected_mean_control}, got {mean_control}.")
-                    print(f"Expected treatment {expected_mean_treatment}, got {mean_treatment}.")
-
-                # Validate log fold change
-                expected_log_fold_change = math.log2(expected_mean_treatment / expected_mean_control) if expected_mean_control > 0 else float('inf')
-                if not math.isclose(log_fold_change, expected_log_fold_change):
-                    print(f"Mismatch in log fold change for {gene_id}: expected {expected_log_fold_change}, got {log_fold_change}.")
-            else:
-                print(f"Gene ID {gene_id} not found in control or treatment data.")
+    return normalized_data
 
-# insert main statement
-def main():
-    # Read and normalize control and treatment data
-    control_data = read_and_normalize_data(control_dir)
-    treatment_data = read_and_normalize_data(treatment_dir)
+# Function to read and normalize gene expression data from CSV files
+def read_and_normalize_data(directory):
+    (gene_ids, matrix), = load_normalized_matrices([directory])
+    return summarize_matrix(gene_ids, matrix)
 
-    # Prepare the summary results
+# Function to calculate the log2 Fold Change summary row of every gene present in both groups
+def build_summary(control_data, treatment_data, warn=True):
     summary = []
 
-    # Calculate log2 Fold Change
     for gene_id in control_data.keys():
         if gene_id in treatment_data:
             mean_control = control_data[gene_id]['mean']
@@ -120,53 +59,68 @@ def main():
             mean_treatment = treatment_data[gene_id]['mean']
             median_treatment = treatment_data[gene_id]['median']
             
-            # Log2 Fold Change calculation
-            # log_fold_change = math.log2(mean_treatment / mean_control) if mean_control > 0 else float('inf')
-
-            # Handle edge cases for log2 Fold Change calculation (0, inf, -inf) 
-            if mean_treatment == 0 and mean_control == 0:
-                log_fold_change = 0  # No change when both means are 0
-            elif mean_control == 0:
-                log_fold_change = float('inf')  # Infinite up-regulation if control is 0 but treatment is not
-            elif mean_treatment == 0:
-                log_fold_change = float('-inf')  # Infinite down-regulation if treatment is 0 but control is not
-            else:
-                log_fold_change = math.log2(mean_treatment / mean_control)  # Regular log2 fold change
+            # Log2 Fold Change calculation, handling the edge cases (0, inf, -inf)
+            log_fold_change = calculate_log_fold_change(mean_control, mean_treatment)
 
             summary.append((gene_id, mean_control, median_control, mean_treatment, median_treatment, log_fold_change))
-        else:
+        elif warn:
             print(f"Warning: {gene_id} not found in treatment data")  # Debugging statement
 
-    # Sort the summary by log2 Fold Change (lowest first)
-    summary.sort(key=lambda x: x[5])
+    return summary
+
+# Function to check calculated values
+# Loads a whole summary (.npy binary or TSV text) and compares every field against freshly computed
+# results with array operations. With median_error (streaming mode) the medians only have to agree within
+# that relative error. Returns the number of problems found.
+def validate_output(file_path, control_data, treatment_data, median_error=None):
+    observed = read_summary(file_path)
+    expected = build_summary_table(build_summary(control_data, treatment_data, warn=False))
+    tolerances = None if median_error is None else {'median_control': median_error, 'median_treatment': median_error}
+    missing, mismatches, genes, observed_rows, expected_rows = compare_summaries(observed, expected,
+                                                                                 field_tolerances=tolerances)
+
+    for gene_id in missing:
+        print(f"Gene ID {gene_id} not found in control or treatment data.")
+
+    problems = len(missing)
+    for name, mismatch in mismatches.items():
+        for i in np.flatnonzero(mismatch):
+            print(f"Mismatch in {name} for {genes[i]}: expected {expected[name][expected_rows[i]]}, "
+                  f"got {observed[name][observed_rows[i]]}.")
+        problems += int(mismatch.sum())
+    return problems
+
+# insert main statement
+def main(argv=None):
+    args = parse_arguments(argv)
+    cache = ExpressionFileCache(args.cache) if args.cache else None
+
+    # Read and normalize control and treatment data and calculate log2 Fold Change
+    # With --stream files are folded one at a time, so memory stays O(genes) however many experiments there are
+    result = compare(args.control_dir, args.treatment_dir, test=None, workers=args.workers, cache=cache,
+                     stream=args.stream, median_error=args.median_error, verbose=True)
+
+    # Prepare the summary results, sorted by log2 Fold Change (lowest first)
+    summary = summary_rows(result)
 
     # Write the output to a tab-delimited file
-    with open('output_Tier1.txt', mode='w', newline='') as f:
-        writer = csv.writer(f, delimiter='\t')
-        # Write header
-        writer.writerow(['#gene', 
-                        '(mean normalized control expression)', 
-                        '(median normalized control expression)', 
-                        '(mean normalized treatment expression)', 
-                        '(median normalized treatment expression)', 
-                        '(logFoldChange)'])
-        
-        # Write data
-        for row in summary:
-            writer.writerow(row)
+    export_tsv_rows(args.output, summary, with_p_value=False)
+
+    # Optionally write the same summary as a binary, memory-mappable table in one call
+    if args.summary:
+        write_summary(args.summary, build_summary_table(summary))
 
     # Final check on the summary data
     print(f"Total genes processed: {len(summary)}")  # Debugging statement
-    
-    # # Load control and treatment data for validation
-    # control_data = read_and_normalize_data('control_files')
-    # treatment_data = read_and_normalize_data('treatment_files')
-    
-    # # Validate the output file
-    # validate_output('gene_expression_summary.txt', control_data, treatment_data)
-    
-    # # Final check on the validation
-    # print("Validation complete.")  # Debugging statement
+
+    # Validate the output file against freshly computed (exact) data; streamed medians are checked within
+    # --median-error
+    if args.validate:
+        control_data = read_and_normalize_data(args.control_dir)
+        treatment_data = read_and_normalize_data(args.treatment_dir)
+        problems = validate_output(args.summary or args.output, control_data, treatment_data,
+                                   args.median_error if args.stream else None)
+        print(f"Validation complete. Problems found: {problems}")  # Debugging statement
     
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
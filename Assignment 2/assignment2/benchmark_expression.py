@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+from expression_api import compare
+from expression_matrix import load_normalized_matrices
+from expression_stats import mann_whitney_u_all, UNullCache
+from generate_expression_data import generate_dataset
+
+
+# Function to read the peak resident set size of the largest finished child process, in bytes
+def child_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KiB, macOS bytes
+
+
+# Function to run one stage and record its wall time and peak traced memory
+# The stage runs twice: once untraced for the wall time, as tracemalloc slows every allocation of this process (and
+# not those of worker processes, which would skew serial against parallel timings), and once under tracemalloc for
+# the peak. tracemalloc only sees this process, so for a stage that runs worker processes (children=True)
+# peak_bytes is None; parent_peak_bytes keeps the traced figure and child_peak_rss_bytes the largest worker's peak
+# RSS (a process-wide high-water mark, so it can include earlier stages' workers).
+def measure(stage, function, *args, children=False, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if not children:
+        return result, {'stage': stage, 'seconds': seconds, 'peak_bytes': peak}
+    return result, {'stage': stage, 'seconds': seconds, 'peak_bytes': None, 'parent_peak_bytes': peak,
+                    'child_peak_rss_bytes': child_peak_rss()}
+
+
+# Function to benchmark the pipeline stages on one synthetic dataset
+# Stages: loading + normalization (read_and_normalize_data's engine), the mean/median/fold-change
+# summary, and the all-genes Mann-Whitney U test (normal approximation and exact).
+def benchmark_size(directory, n_genes, n_files, workers=1, dropout=0.0, tie_fraction=0.0, seed=0):
+    control_dir, treatment_dir = generate_dataset(directory, n_genes, n_files, dropout, tie_fraction, seed=seed)
+
+    records = []
+    loaded, record = measure('read_and_normalize_data', load_normalized_matrices, [control_dir, treatment_dir],
+                             workers, verbose=False, children=workers > 1)
+    records.append(record)
+    (control_ids, control_matrix), (treatment_ids, treatment_matrix) = loaded
+
+    _, record = measure('fold_change', compare, loaded[0], loaded[1], test=None)
+    records.append(record)
+
+    _, record = measure('mann_whitney_u_test', mann_whitney_u_all, control_matrix, treatment_matrix)
+    records.append(record)
+
+    # A fresh null cache per run, so the traced run does not reuse the tables of the timed one
+    _, record = measure('mann_whitney_u_test_exact',
+                        lambda: mann_whitney_u_all(control_matrix, treatment_matrix, True, UNullCache()))
+    records.append(record)
+
+    for record in records:
+        record.update(genes=n_genes, files=n_files, workers=workers, dropout=dropout, ties=tie_fraction)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile the expression pipeline across a size grid.")
+    parser.add_argument('--genes', default='1000,10000', help="Comma-separated gene counts, e.g. 1000,10000,100000")
+    parser.add_argument('--files', default='10,100', help="Comma-separated file counts per group, e.g. 10,100,1000")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--dropout', type=float, default=0.1)
+    parser.add_argument('--ties', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'records': [],
+    }
+    for n_genes in [int(value) for value in args.genes.split(',')]:
+        for n_files in [int(value) for value in args.files.split(',')]:
+            with tempfile.TemporaryDirectory() as directory:
+                records = benchmark_size(directory, n_genes, n_files, args.workers, args.dropout, args.ties, args.seed)
+            results['records'].extend(records)
+            for record in records:
+                if record['peak_bytes'] is None:
+                    memory = (f"parent peak {record['parent_peak_bytes'] / 2 ** 20:.1f} MiB, "
+                              f"worker peak RSS {record['child_peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+                else:
+                    memory = f"peak {record['peak_bytes'] / 2 ** 20:.1f} MiB"
+                print(f"genes={n_genes} files={n_files} {record['stage']}: {record['seconds']:.3f}s, {memory}",
+                      file=sys.stderr)
+
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
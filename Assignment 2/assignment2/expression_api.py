@@ -0,0 +1,157 @@
+import argparse
+import csv
+import math
+import numpy as np
+from expression_matrix import load_normalized_matrices, summarize_expression
+from expression_stream import stream_directory
+from expression_stats import mann_whitney_u_all, permutation_log_fold_change_test
+from expression_summary import build_summary_table, write_summary, TSV_HEADER
+
+
+# Function to calculate one log2 Fold Change with the edge cases used by both tiers (0, inf, -inf)
+def log_fold_change(mean_control, mean_treatment):
+    if mean_treatment == 0 and mean_control == 0:
+        return 0  # No change when both means are 0
+    elif mean_control == 0:
+        return float('inf')  # Infinite up-regulation if control is 0 but treatment is not
+    elif mean_treatment == 0:
+        return float('-inf')  # Infinite down-regulation if treatment is 0 but control is not
+    return math.log2(mean_treatment / mean_control)  # Regular log2 fold change
+
+
+# Function to compare a control group with a treatment group and return the per-gene results as arrays
+# `control` and `treatment` are directories or already loaded (gene_ids, normalized matrix) pairs, so a
+# shared group can be loaded once and reused. `test` is 'mannwhitney', 'permutation' or None (no p-value).
+# Returns a dict with 'gene' (list) and float arrays 'mean_control', 'median_control', 'mean_treatment',
+# 'median_treatment', 'log_fold_change' and, when a test is run, 'p_value'; genes are those present in
+# both groups, in control order.
+def compare(control, treatment, test='mannwhitney', exact=False, null_cache=None, num_permutations=10000,
+            seed=None, early_stop=None, workers=1, cache=None, stream=False, median_error=0.01, verbose=False):
+    if stream:
+        if test is not None:
+            raise ValueError("Streaming mode only computes means and medians; use test=None")
+        if cache is not None:
+            raise ValueError("Streaming mode reads every file once and does not use the file cache")
+        control_ids, control_means, control_medians = stream_directory(control, median_error, workers, verbose)
+        treatment_ids, treatment_means, treatment_medians = stream_directory(treatment, median_error, workers, verbose)
+        control_matrix = treatment_matrix = None
+    else:
+        to_load = [group for group in (control, treatment) if isinstance(group, str)]
+        loaded = iter(load_normalized_matrices(to_load, workers, verbose, cache) if to_load else [])
+        control_ids, control_matrix = next(loaded) if isinstance(control, str) else control
+        treatment_ids, treatment_matrix = next(loaded) if isinstance(treatment, str) else treatment
+        control_means, control_medians = summarize_expression(control_matrix)
+        treatment_means, treatment_medians = summarize_expression(treatment_matrix)
+
+    treatment_index = {gene_id: row for row, gene_id in enumerate(treatment_ids)}
+    if verbose:
+        for gene_id in control_ids:
+            if gene_id not in treatment_index:
+                print(f"Warning: {gene_id} not found in treatment data")  # Debugging statement
+    control_rows = np.array([row for row, gene_id in enumerate(control_ids) if gene_id in treatment_index],
+                            dtype=np.intp)
+    genes = [control_ids[row] for row in control_rows]
+    treatment_rows = np.array([treatment_index[gene_id] for gene_id in genes], dtype=np.intp)
+
+    result = {
+        'gene': genes,
+        'mean_control': control_means[control_rows],
+        'median_control': control_medians[control_rows],
+        'mean_treatment': treatment_means[treatment_rows],
+        'median_treatment': treatment_medians[treatment_rows],
+    }
+    result['log_fold_change'] = np.array([log_fold_change(c, t) for c, t in
+                                          zip(result['mean_control'].tolist(), result['mean_treatment'].tolist())],
+                                         dtype=np.float64)
+
+    if test == 'permutation':
+        result['p_value'], _ = permutation_log_fold_change_test(control_matrix[control_rows],
+                                                                treatment_matrix[treatment_rows],
+                                                                num_permutations, seed, early_stop)
+    elif test == 'mannwhitney':
+        _, _, result['p_value'] = mann_whitney_u_all(control_matrix[control_rows], treatment_matrix[treatment_rows],
+                                                     exact, null_cache)
+    elif test is not None:
+        raise ValueError(f"Unknown test: {test}")
+
+    return result
+
+
+# Function to turn a compare() result into summary rows, sorted by p-value if present, else by log2 Fold Change
+def summary_rows(result):
+    columns = ['mean_control', 'median_control', 'mean_treatment', 'median_treatment', 'log_fold_change']
+    if 'p_value' in result:
+        columns.append('p_value')
+    values = [result[name].tolist() for name in columns]
+
+    rows = []
+    for gene_id, *row in zip(result['gene'], *values):
+        if row[0] == 0 and row[2] == 0:
+            row[4] = 0  # Written as 0, like the scripts do when both means are 0
+        rows.append((gene_id, *row))
+    rows.sort(key=lambda x: x[-1] if 'p_value' in result else x[5])
+    return rows
+
+
+# Function to write a compare() result as TSV, or as a binary summary when the path ends in .npy
+def write_result(path, result):
+    rows = summary_rows(result)
+    if path.endswith('.npy'):
+        write_summary(path, build_summary_table(rows))
+    else:
+        export_tsv_rows(path, rows, 'p_value' in result)
+
+
+# Function to write summary rows to a tab-delimited file with the scripts' header
+def export_tsv_rows(path, rows, with_p_value):
+    header = TSV_HEADER if with_p_value else TSV_HEADER[:-1]
+    with open(path, mode='w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+# Function to read a batch manifest: one "control_dir<TAB>treatment_dir<TAB>output_path" line per contrast
+def read_manifest(path):
+    contrasts = []
+    with open(path, mode='r') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            control, treatment, output = line.rstrip('\n').split('\t')[:3]
+            contrasts.append((control, treatment, output))
+    return contrasts
+
+
+# Function to run every contrast of a manifest in one process
+# Each distinct directory is loaded exactly once (all of them on the same worker pool) and reused by
+# every contrast that mentions it.
+def run_batch(contrasts, test='mannwhitney', workers=1, cache=None, verbose=True, **options):
+    directories = list(dict.fromkeys(directory for control, treatment, _ in contrasts
+                                     for directory in (control, treatment)))
+    loaded = dict(zip(directories, load_normalized_matrices(directories, workers, verbose, cache)))
+
+    for control, treatment, output in contrasts:
+        result = compare(loaded[control], loaded[treatment], test, **options)
+        write_result(output, result)
+        if verbose:
+            print(f"{control} vs {treatment}: {len(result['gene'])} genes -> {output}")  # Debugging statement
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many control/treatment comparisons from one manifest.")
+    parser.add_argument('manifest', help="TSV with control_dir, treatment_dir and output path per line")
+    parser.add_argument('--test', choices=['mannwhitney', 'permutation', 'none'], default='mannwhitney')
+    parser.add_argument('--exact', action='store_true')
+    parser.add_argument('--permutations', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--early-stop', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    run_batch(read_manifest(args.manifest), None if args.test == 'none' else args.test, args.workers,
+              exact=args.exact, num_permutations=args.permutations, seed=args.seed, early_stop=args.early_stop)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from expression_matrix import list_experiment_files, read_normalized_expression_file
+
+
+# Function to compute the SHA-256 content hash of a file in fixed-size blocks
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# On-disk cache of per-file normalized expression vectors
+# Every data directory gets its own subdirectory holding one .npz per experiment file and a
+# manifest.json of (size, mtime, sha256) fingerprints. A file is re-parsed only when its size or
+# mtime changed and its content hash no longer matches; entries of deleted files are dropped.
+class ExpressionFileCache:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_directory(self, data_directory):
+        key = hashlib.sha256(os.path.abspath(data_directory).encode()).hexdigest()[:16]
+        path = os.path.join(self.directory, key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _load_manifest(self, entry_directory):
+        path = os.path.join(entry_directory, 'manifest.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path, mode='r') as f:
+            return json.load(f)
+
+    def _save_manifest(self, entry_directory, manifest):
+        path = os.path.join(entry_directory, 'manifest.json')
+        with open(path + '.tmp', mode='w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)  # Never leave a half-written manifest behind
+
+    # Normalized (gene IDs, values) columns for every file of a directory, in file order
+    def columns(self, data_directory, workers=1, verbose=True):
+        entry_directory = self._entry_directory(data_directory)
+        manifest = self._load_manifest(entry_directory)
+        files = list_experiment_files(data_directory)
+
+        stale = []
+        for file in files:
+            stat = os.stat(os.path.join(data_directory, file))
+            entry = manifest.get(file)
+            if not os.path.exists(os.path.join(entry_directory, file + '.npz')):
+                entry = None  # The cached vector went missing, so parse the file again
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            digest = file_digest(os.path.join(data_directory, file))
+            if entry and entry['sha256'] == digest:
+                # Touched but unchanged: refresh the fingerprint and keep the cached vector
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                continue
+            manifest[file] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+            stale.append(file)
+
+        for file in stale:
+            if verbose:
+                print(f"Processing file: {file} ({data_directory})")  # Debugging statement
+        paths = [os.path.join(data_directory, file) for file in stale]
+        if workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(read_normalized_expression_file, paths))
+        else:
+            parsed = [read_normalized_expression_file(path) for path in paths]
+        parsed = dict(zip(stale, parsed))
+
+        for file, (gene_ids, values) in parsed.items():
+            np.savez(os.path.join(entry_directory, file + '.npz'), gene_ids=np.array(gene_ids, dtype=str), values=values)
+
+        # Drop the entries of files that no longer exist
+        for file in set(manifest) - set(files):
+            del manifest[file]
+            cached = os.path.join(entry_directory, file + '.npz')
+            if os.path.exists(cached):
+                os.remove(cached)
+        self._save_manifest(entry_directory, manifest)
+
+        if verbose:
+            print(f"Reused {len(files) - len(stale)} cached files ({data_directory})")  # Debugging statement
+
+        columns = []
+        for file in files:
+            if file in parsed:
+                columns.append(parsed[file])
+                continue
+            with np.load(os.path.join(entry_directory, file + '.npz')) as cached:
+                columns.append((cached['gene_ids'].tolist(), cached['values']))
+        return columns
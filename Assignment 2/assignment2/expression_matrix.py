@@ -0,0 +1,196 @@
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Python 3.12+ sums floats with Neumaier compensation, older versions add left to right.
+# The matrix reductions below mirror whichever one sum() uses so output stays byte-identical.
+COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+# Function to list the experiment CSV files of a directory in the order they are processed
+def list_experiment_files(directory):
+    return [file for file in os.listdir(directory) if file.endswith('.csv')]
+
+
+# Function to parse one experiment CSV into gene IDs and raw expression values
+def read_expression_file(path):
+    with open(path, mode='r') as f:
+        lines = f.read().splitlines()[1:]  # Skip header row
+
+    # Split every row in one pass and convert the whole expression column at once
+    rows = [line.split(',', 2) for line in lines if line]  # Skip empty rows
+    gene_ids = [row[0] for row in rows]
+    values = np.array([row[1] for row in rows], dtype=np.float64)
+    return gene_ids, values
+
+
+# Function to compute the library size (total expression) of one file in file order
+def library_size(values):
+    # cumsum adds left to right, the same order as a running total over the file's rows
+    return np.cumsum(values)[-1] if len(values) else 0.0
+
+
+# Function to build one dense genes x samples matrix from a list of per-file columns
+# Returns the gene IDs (first-seen order), the raw matrix and the library size of every column
+def assemble_expression_matrix(columns):
+    gene_ids = []
+    gene_index = {}
+    placed = []  # (row indices or None for the shared layout, values) per column
+    layout = None
+
+    for ids, values in columns:
+        if layout is not None and ids == layout:
+            placed.append((None, values))
+            continue
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate gene IDs within a single experiment file are not supported")
+        rows = np.empty(len(ids), dtype=np.intp)
+        for i, gene_id in enumerate(ids):
+            if gene_id not in gene_index:
+                gene_index[gene_id] = len(gene_ids)
+                gene_ids.append(gene_id)
+            rows[i] = gene_index[gene_id]
+        if layout is None:
+            layout = ids
+            layout_rows = rows
+        placed.append((rows, values))
+
+    # Genes missing from a file are stored as NaN and ignored by the reductions
+    matrix = np.full((len(gene_ids), len(placed)), np.nan, dtype=np.float64)
+    library_sizes = np.empty(len(placed), dtype=np.float64)
+    for col, (rows, values) in enumerate(placed):
+        matrix[layout_rows if rows is None else rows, col] = values
+        library_sizes[col] = library_size(values)
+
+    return gene_ids, matrix, library_sizes
+
+
+# Function to load every experiment in a directory as a genes x samples matrix
+def load_expression_matrix(directory, verbose=True):
+    columns = []
+    for file in list_experiment_files(directory):
+        if verbose:
+            print(f"Processing file: {file} ({directory})")  # Debugging statement
+        columns.append(read_expression_file(os.path.join(directory, file)))
+    return assemble_expression_matrix(columns)
+
+
+# Function to divide every column by its library size in a single broadcast
+def normalize_library_size(matrix, library_sizes):
+    return matrix / library_sizes
+
+
+# Function to parse and library-size-normalize one experiment file (runs on a pool worker)
+def read_normalized_expression_file(path):
+    gene_ids, values = read_expression_file(path)
+    return gene_ids, values / library_size(values)
+
+
+# Function to yield the normalized (gene IDs, values) column of every file in a directory, in file order
+def iter_normalized_columns(directory, workers=1, verbose=True):
+    paths = []
+    for file in list_experiment_files(directory):
+        if verbose:
+            print(f"Processing file: {file} ({directory})")  # Debugging statement
+        paths.append(os.path.join(directory, file))
+
+    if workers <= 1:
+        for path in paths:
+            yield read_normalized_expression_file(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(read_normalized_expression_file, paths)
+
+
+# Function to load several directories as normalized genes x samples matrices
+# With workers > 1 every file of every directory is parsed and normalized on a process pool at
+# the same time; results are merged back in each directory's file order so output is deterministic.
+# With a cache (see expression_cache.ExpressionFileCache) only new or changed files are parsed.
+def load_normalized_matrices(directories, workers=1, verbose=True, cache=None):
+    if cache is not None:
+        loaded = []
+        for directory in directories:
+            gene_ids, matrix, _ = assemble_expression_matrix(cache.columns(directory, workers, verbose))
+            loaded.append((gene_ids, matrix))
+        return loaded
+
+    if workers <= 1:
+        loaded = []
+        for directory in directories:
+            gene_ids, matrix, library_sizes = load_expression_matrix(directory, verbose)
+            loaded.append((gene_ids, normalize_library_size(matrix, library_sizes)))
+        return loaded
+
+    paths = []
+    counts = []
+    for directory in directories:
+        files = list_experiment_files(directory)
+        for file in files:
+            if verbose:
+                print(f"Processing file: {file} ({directory})")  # Debugging statement
+            paths.append(os.path.join(directory, file))
+        counts.append(len(files))
+
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        columns = list(pool.map(read_normalized_expression_file, paths, chunksize=chunksize))
+
+    loaded = []
+    offset = 0
+    for count in counts:
+        gene_ids, matrix, _ = assemble_expression_matrix(columns[offset:offset + count])
+        loaded.append((gene_ids, matrix))
+        offset += count
+    return loaded
+
+
+# Function to add one column into running per-row totals the same way the builtin sum() does
+def accumulate_column(total, compensation, column):
+    if not COMPENSATED_SUM:
+        total += column
+        return
+    t = total + column
+    compensation += np.where(np.abs(total) >= np.abs(column), (total - t) + column, (column - t) + total)
+    total[:] = t
+
+
+# Function to fold the Neumaier compensation into the running totals once all columns are added
+def finish_row_sum(total, compensation):
+    apply = (compensation != 0) & np.isfinite(compensation)
+    result = total.copy()
+    result[apply] += compensation[apply]
+    return result
+
+
+# Function to sum each row in column order, matching the builtin sum() of a per-gene list
+def sequential_row_sum(matrix):
+    total = np.zeros(matrix.shape[0], dtype=np.float64)
+    compensation = np.zeros_like(total)
+    for col in range(matrix.shape[1]):
+        accumulate_column(total, compensation, np.nan_to_num(matrix[:, col], nan=0.0))
+    return finish_row_sum(total, compensation)
+
+
+# Function to compute per-gene mean and median across all samples of a normalized matrix
+def summarize_expression(matrix):
+    present = ~np.isnan(matrix)
+    counts = present.sum(axis=1)
+    means = sequential_row_sum(matrix) / counts
+
+    # NaN sorts to the end of each row, so the present values occupy the first `counts` slots
+    ordered = np.sort(matrix, axis=1)
+    rows = np.arange(matrix.shape[0])
+    upper = ordered[rows, counts // 2]
+    lower = ordered[rows, np.maximum(counts // 2 - 1, 0)]
+    medians = np.where(counts % 2 != 0, upper, (lower + upper) / 2)
+
+    return means, medians
+
+
+# Function to pull the present values of one gene in file order (for per-gene statistics)
+def gene_expressions(matrix, row):
+    values = matrix[row]
+    return values[~np.isnan(values)].tolist()
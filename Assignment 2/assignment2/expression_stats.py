@@ -0,0 +1,229 @@
+import math
+import os
+import numpy as np
+from collections import OrderedDict
+
+
+# Largest replicate layout (n1 * n2) for which the exact null distribution is tabulated
+EXACT_MAX_CELLS = 10000
+
+# Label permutations drawn from each child seed of the permutation test
+CHUNK_PERMUTATIONS = 1000
+
+
+# Function to rank every row of a matrix with midranks for ties (NaN entries are left unranked)
+# Returns the ranks (NaN where the input is NaN) and the per-row tie term sum(t^3 - t)
+def midrank_rows(matrix):
+    n_rows, n_cols = matrix.shape
+    order = np.argsort(matrix, axis=1, kind='stable')
+    ordered = np.take_along_axis(matrix, order, axis=1)
+    counts = (~np.isnan(matrix)).sum(axis=1)
+
+    # A new tie group starts wherever the sorted value changes (NaN never equals anything)
+    positions = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    starts_group = np.ones((n_rows, n_cols), dtype=bool)
+    starts_group[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends_group = np.ones((n_rows, n_cols), dtype=bool)
+    ends_group[:, :-1] = starts_group[:, 1:]
+
+    group_start = np.maximum.accumulate(np.where(starts_group, positions, 0), axis=1)
+    group_end = np.minimum.accumulate(np.where(ends_group, positions, n_cols - 1)[:, ::-1], axis=1)[:, ::-1]
+    sorted_ranks = (group_start + group_end) / 2 + 1
+
+    present = positions < counts[:, None]
+    tie_size = (group_end - group_start + 1).astype(np.float64)
+    # Each member of a group of size t contributes t^2 - 1, so a group sums to t^3 - t
+    tie_term = np.where(present, tie_size ** 2 - 1, 0).sum(axis=1)
+
+    ranks = np.full((n_rows, n_cols), np.nan)
+    np.put_along_axis(ranks, order, np.where(present, sorted_ranks, np.nan), axis=1)
+    return ranks, tie_term
+
+
+# Function to compute the exact null CDF of U for group sizes n1 and n2 (no ties)
+# The counts of U are the coefficients of the Gaussian binomial [n1 + n2 choose n1]_q, built one
+# factor (1 - q^(n2 + i)) / (1 - q^i) at a time with exact integers; entry u is P(U <= u).
+def u_null_cdf(n1, n2):
+    n1, n2 = min(n1, n2), max(n1, n2)
+    size = n1 * n2 + 1
+    counts = np.zeros(size, dtype=object)
+    counts[0] = 1
+    for i in range(1, n1 + 1):
+        # Multiply by (1 - q^(n2 + i))
+        shift = n2 + i
+        if shift < size:
+            counts[shift:] = counts[shift:] - counts[:size - shift].copy()
+        # Divide by (1 - q^i): a running sum with stride i
+        for residue in range(i):
+            counts[residue::i] = np.cumsum(counts[residue::i])
+
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    return np.array([int(c) / total for c in cumulative], dtype=np.float64)
+
+
+# In-memory LRU cache of exact U null distributions keyed by (n1, n2), optionally persisted to disk
+# Every gene that shares a replicate layout reuses one table.
+class UNullCache:
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.tables = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, n1, n2):
+        key = (min(n1, n2), max(n1, n2))  # The distribution is symmetric in the two groups
+        if key in self.tables:
+            self.tables.move_to_end(key)
+            return self.tables[key]
+
+        path = os.path.join(self.directory, f"u_null_{key[0]}_{key[1]}.npy") if self.directory else None
+        if path is not None and os.path.exists(path):
+            table = np.load(path)
+        else:
+            table = u_null_cdf(*key)
+            if path is not None:
+                np.save(path, table)
+
+        self.tables[key] = table
+        if len(self.tables) > self.maxsize:
+            self.tables.popitem(last=False)
+        return table
+
+
+# Shared cache used when no cache is passed explicitly
+default_null_cache = UNullCache()
+
+
+# Function to compute exact two-sided p-values for the genes that allow it, leaving the rest untouched
+# Genes qualify when they have no ties and their layout is within EXACT_MAX_CELLS.
+def exact_p_values(u, n1, n2, tie_term, p_values, null_cache=None):
+    null_cache = default_null_cache if null_cache is None else null_cache
+    p_values = p_values.copy()
+    eligible = (tie_term == 0) & (n1 > 0) & (n2 > 0) & (n1 * n2 <= EXACT_MAX_CELLS)
+
+    layouts = np.stack([n1[eligible], n2[eligible]], axis=1).astype(np.int64)
+    for layout in np.unique(layouts, axis=0):
+        genes = np.flatnonzero(eligible & (n1 == layout[0]) & (n2 == layout[1]))
+        cdf = null_cache.get(int(layout[0]), int(layout[1]))
+        p_values[genes] = np.minimum(1.0, 2 * cdf[u[genes].astype(np.int64)])
+    return p_values
+
+
+# Function to run a two-sided Mann-Whitney U test on every gene at once
+# Rows of the two matrices are the same genes; columns are samples (NaN = missing sample).
+# Returns arrays of U (the smaller of U and U'), the tie-corrected z-score and the p-value. The p-value
+# uses the normal approximation unless exact=True, in which case genes without ties get the exact
+# p-value from the null distribution of their (n1, n2) layout.
+def mann_whitney_u_all(control_matrix, treatment_matrix, exact=False, null_cache=None):
+    combined = np.hstack([control_matrix, treatment_matrix])
+    ranks, tie_term = midrank_rows(combined)
+
+    n1 = (~np.isnan(control_matrix)).sum(axis=1).astype(np.float64)
+    n2 = (~np.isnan(treatment_matrix)).sum(axis=1).astype(np.float64)
+    n = n1 + n2
+
+    rank_sum_control = np.nansum(ranks[:, :control_matrix.shape[1]], axis=1)
+    u_stat = rank_sum_control - (n1 * (n1 + 1)) / 2  # U-statistic for control group
+    u_prime = n1 * n2 - u_stat  # U' (alternative U statistic)
+    u = np.minimum(u_stat, u_prime)
+
+    mean_u = (n1 * n2) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correction = np.where(n > 1, tie_term / (n * (n - 1)), 0.0)
+        std_u = np.sqrt(n1 * n2 * ((n + 1) - correction) / 12)
+        z = (u - mean_u) / std_u  # Z-score
+
+    # Approximate two-tailed p-value; genes with no spread at all (or an empty group) get p = 1
+    erf = np.frompyfunc(math.erf, 1, 1)
+    p_values = 2 * (1 - (0.5 * (1 + erf(np.abs(z) / math.sqrt(2)).astype(np.float64))))
+    p_values = np.where(std_u > 0, p_values, 1.0)
+    if exact:
+        p_values = exact_p_values(u, n1, n2, tie_term, p_values, null_cache)
+
+    return u, z, p_values
+
+
+# Function to compute |log2 fold change| of treatment over control means, with the same edge
+# cases as main(): both means 0 -> 0, exactly one mean 0 -> infinity
+def absolute_log_fold_change(mean_control, mean_treatment):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.abs(np.log2(mean_treatment / mean_control))
+    change = np.where((mean_control == 0) != (mean_treatment == 0), np.inf, change)
+    return np.where((mean_control == 0) & (mean_treatment == 0), 0.0, change)
+
+
+# Function to yield the label permutations of the permutation test as index matrices, one chunk at a time
+# Chunk i holds permutations [i * CHUNK_PERMUTATIONS, (i + 1) * CHUNK_PERMUTATIONS) and is drawn from child i of
+# SeedSequence(seed), so the permutation stream depends only on the seed, not on how it is batched.
+def seeded_label_permutations(n_samples, num_permutations, seed=None):
+    children = np.random.SeedSequence(seed).spawn(-(-num_permutations // CHUNK_PERMUTATIONS))
+    for i, child in enumerate(children):
+        size = min(CHUNK_PERMUTATIONS, num_permutations - i * CHUNK_PERMUTATIONS)
+        yield np.random.default_rng(child).permuted(np.tile(np.arange(n_samples), (size, 1)), axis=1)
+
+
+# Function to run a two-sided label-permutation test of the log fold change on every gene at once
+# Each batch draws permutations of the pooled sample labels as an index matrix, turns them into a
+# samples x batch treatment-indicator matrix and gets every permuted group mean from two matrix
+# products. Batch size follows `memory_budget` (bytes); the permutations themselves come from
+# seeded_label_permutations, so a fixed seed gives the same p-values for any budget. With `early_stop` set, a gene stops once
+# that many permuted statistics reach the observed one (Besag-Clifford), and its p-value is
+# early_stop / permutations used; otherwise p = (exceedances + 1) / (permutations + 1).
+# Returns the p-values and the number of permutations used per gene.
+def permutation_log_fold_change_test(control_matrix, treatment_matrix, num_permutations=10000, seed=None,
+                                     early_stop=None, memory_budget=256 * 2 ** 20):
+    combined = np.hstack([control_matrix, treatment_matrix])
+    present = (~np.isnan(combined)).astype(np.float64)
+    values = np.nan_to_num(combined, nan=0.0)
+    n_genes, n_samples = combined.shape
+    n_control = control_matrix.shape[1]
+
+    # Observed statistic from the real labels
+    labels = np.zeros(n_samples)
+    labels[n_control:] = 1
+    observed = absolute_log_fold_change(values @ (1 - labels) / (present @ (1 - labels)),
+                                        values @ labels / (present @ labels))
+
+    exceed = np.zeros(n_genes, dtype=np.int64)
+    used = np.zeros(n_genes, dtype=np.int64)
+    active = np.arange(n_genes)
+
+    # Roughly four genes x batch float64 temporaries are alive per batch
+    batch_size = int(max(1, min(num_permutations, memory_budget // (8 * 4 * max(n_genes, 1)))))
+    chunks = seeded_label_permutations(n_samples, num_permutations, seed)
+    pending = np.zeros((0, n_samples), dtype=np.int64)
+    done = 0
+    while done < num_permutations and len(active):
+        batch = min(batch_size, num_permutations - done)
+        while len(pending) < batch:
+            pending = np.vstack([pending, next(chunks)])
+        order, pending = pending[:batch], pending[batch:]
+        treated = np.zeros((n_samples, batch))
+        treated[order[:, n_control:], np.arange(batch)[:, None]] = 1
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_treatment = (values[active] @ treated) / (present[active] @ treated)
+            mean_control = (values[active] @ (1 - treated)) / (present[active] @ (1 - treated))
+        hits = absolute_log_fold_change(mean_control, mean_treatment) >= observed[active, None]
+
+        if early_stop is None:
+            exceed[active] += hits.sum(axis=1)
+            used[active] += batch
+        else:
+            # Stop each gene at the permutation where it reached `early_stop` exceedances
+            running = exceed[active, None] + np.cumsum(hits, axis=1)
+            reached = running >= early_stop
+            stopped = reached.any(axis=1)
+            stop_at = np.where(stopped, reached.argmax(axis=1) + 1, batch)
+            exceed[active] = running[np.arange(len(active)), stop_at - 1]
+            used[active] += stop_at
+            active = active[~stopped]
+        done += batch
+
+    p_values = (exceed + 1) / (used + 1)
+    if early_stop is not None:
+        stopped = exceed >= early_stop
+        p_values[stopped] = exceed[stopped] / used[stopped]
+    return p_values, used
@@ -0,0 +1,213 @@
+import math
+import numpy as np
+from expression_matrix import accumulate_column, finish_row_sum, iter_normalized_columns
+
+
+# Buckets kept per gene: 1024 buckets at 1% relative error span a factor of about 8e8 (nine decades) in value
+DEFAULT_MAX_BUCKETS = 1024
+
+# Unsigned types the bucket counts are widened through as the number of files grows
+COUNT_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+# Genes whose windows are processed together in result() and when windows move, which bounds the int64 temporaries
+RANK_BLOCK_GENES = 1024
+
+# Window offset of a gene that has not seen a positive value yet
+UNSET = np.iinfo(np.int64).min
+
+
+# Streaming per-gene summary with O(genes) memory
+# Each file is folded into running count/sum accumulators (so the mean is exact) and into a
+# log-bucketed quantile sketch (DDSketch layout) that gives the median within a relative
+# error of `relative_error`. Every gene has its own window of max_buckets counts, stored as uint8
+# and widened to uint16/uint32 as the file count grows, so the sketch costs max_buckets bytes per
+# gene (2 * max_buckets past 255 files) however different the genes' expression levels are. It
+# takes less memory than the exact float64 matrix once there are more than max_buckets / 8 files
+# (128 by default). A gene's window covers its whole range of positive values as long as they span
+# less than gamma ** max_buckets (nine decades by default). Beyond that the window is moved to keep
+# the gene's current median near its centre and the buckets falling off either end are collapsed
+# into the end buckets, as DDSketch collapses the buckets furthest from the quantile it serves; the
+# running minimum and maximum bound the estimate.
+class StreamingExpressionSummary:
+    def __init__(self, relative_error=0.01, max_buckets=DEFAULT_MAX_BUCKETS):
+        if not 0 < relative_error < 1:
+            raise ValueError("relative_error must be between 0 and 1")
+        self.relative_error = relative_error
+        self.max_buckets = max_buckets
+        self.log_gamma = math.log((1 + relative_error) / (1 - relative_error))
+
+        self.gene_ids = []
+        self.gene_index = {}
+        self.layout = None
+        self.layout_rows = None
+
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.compensation = np.zeros(0, dtype=np.float64)
+        self.zeros = np.zeros(0, dtype=np.int64)
+        self.minimum = np.zeros(0, dtype=np.float64)  # Smallest and largest positive value of each gene
+        self.maximum = np.zeros(0, dtype=np.float64)
+        self.buckets = np.zeros((0, max_buckets), dtype=COUNT_DTYPES[0])
+        self.offsets = np.zeros(0, dtype=np.int64)  # Bucket index of column 0 of each gene's window
+
+    # Map the gene IDs of one file onto accumulator rows, growing the accumulators for new genes
+    def _rows_for(self, ids):
+        if self.layout is not None and ids == self.layout:
+            return self.layout_rows
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate gene IDs within a single experiment file are not supported")
+
+        rows = np.empty(len(ids), dtype=np.intp)
+        for i, gene_id in enumerate(ids):
+            if gene_id not in self.gene_index:
+                self.gene_index[gene_id] = len(self.gene_ids)
+                self.gene_ids.append(gene_id)
+            rows[i] = self.gene_index[gene_id]
+        self._grow_genes(len(self.gene_ids))
+
+        if self.layout is None:
+            self.layout = ids
+            self.layout_rows = rows
+        return rows
+
+    def _grow_genes(self, n_genes):
+        extra = n_genes - len(self.counts)
+        if extra <= 0:
+            return
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(extra, dtype=np.float64)])
+        self.compensation = np.concatenate([self.compensation, np.zeros(extra, dtype=np.float64)])
+        self.zeros = np.concatenate([self.zeros, np.zeros(extra, dtype=np.int64)])
+        self.minimum = np.concatenate([self.minimum, np.full(extra, np.inf)])
+        self.maximum = np.concatenate([self.maximum, np.full(extra, -np.inf)])
+        self.buckets = np.vstack([self.buckets, np.zeros((extra, self.max_buckets), dtype=self.buckets.dtype)])
+        self.offsets = np.concatenate([self.offsets, np.full(extra, UNSET, dtype=np.int64)])
+
+    # Add `weights` to bucket `index` of each of the (distinct) genes `rows`, moving windows where needed
+    def _add_to_buckets(self, rows, index, weights):
+        while self.counts.max(initial=0) > np.iinfo(self.buckets.dtype).max:
+            self.buckets = self.buckets.astype(COUNT_DTYPES[COUNT_DTYPES.index(self.buckets.dtype.type) + 1])
+
+        new = self.offsets[rows] == UNSET
+        self.offsets[rows[new]] = index[new] - self.max_buckets // 2
+
+        position = index - self.offsets[rows]
+        outside = np.flatnonzero((position < 0) | (position >= self.max_buckets))
+        for first in range(0, len(outside), RANK_BLOCK_GENES):
+            block = outside[first:first + RANK_BLOCK_GENES]
+            self._move_windows(rows[block], index[block], weights[block])
+            position[block] = index[block] - self.offsets[rows[block]]
+
+        position = np.clip(position, 0, self.max_buckets - 1)
+        self.buckets[rows, position] += weights.astype(self.buckets.dtype)
+
+    # Move the windows of genes `rows` so they take in `weights` values at bucket `index`, which lies outside them
+    # A window that can hold all of its gene's buckets is shifted without loss. Otherwise it is centred on the
+    # bucket of the gene's median (new values included) and buckets beyond either end are collapsed into the
+    # end buckets, so only values far from the median lose resolution.
+    def _move_windows(self, rows, index, weights):
+        size = self.max_buckets
+        window = self.buckets[rows].astype(np.int64)
+        offsets = self.offsets[rows]
+
+        occupied = window > 0
+        filled = occupied.any(axis=1)
+        lowest = np.minimum(np.where(filled, offsets + occupied.argmax(axis=1), index), index)
+        highest = np.maximum(np.where(filled, offsets + size - 1 - occupied[:, ::-1].argmax(axis=1), index), index)
+
+        # Bucket of the median: rank among the positive values, which the new values precede when below the window
+        zeros = self.zeros[rows]
+        rank = (zeros + window.sum(axis=1) + weights - 1) // 2 - zeros
+        below = index < offsets
+        before = np.where(below, weights, 0)
+        in_window = (np.cumsum(window, axis=1) + before[:, None] <= rank[:, None]).sum(axis=1)
+        median = offsets + in_window
+        median = np.where(below & (rank < weights), index, median)
+        median = np.where(~below & (in_window == size), index, median)
+        median = np.where(rank < 0, lowest, median)  # The median is a zero; keep the lowest values
+
+        start = np.clip(median - size // 2, np.minimum(lowest, highest - size + 1),
+                        np.maximum(lowest, highest - size + 1))
+        target = np.clip(offsets[:, None] + np.arange(size) - start[:, None], 0, size - 1)
+        target += np.arange(len(rows))[:, None] * size
+        moved = np.bincount(target.ravel(), weights=window.ravel(), minlength=len(rows) * size)
+        self.buckets[rows] = moved.reshape(len(rows), size).astype(self.buckets.dtype)
+        self.offsets[rows] = start
+
+    # Fold one normalized file column into the accumulators
+    def add_column(self, ids, values):
+        rows = self._rows_for(ids)
+
+        column = np.zeros(len(self.gene_ids), dtype=np.float64)
+        column[rows] = values
+        self.counts[rows] += 1
+        accumulate_column(self.total, self.compensation, column)
+
+        if np.any(values < 0):
+            raise ValueError("Negative expression values cannot be sketched")
+        positive = values > 0
+        self.zeros[rows[~positive]] += 1
+        if not np.any(positive):
+            return
+
+        rows, values = rows[positive], values[positive]
+        self.minimum[rows] = np.minimum(self.minimum[rows], values)
+        self.maximum[rows] = np.maximum(self.maximum[rows], values)
+        index = np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+        self._add_to_buckets(rows, index, np.ones(len(index), dtype=np.int64))
+
+    # Merge another summary into this one (sketch counts add; means are added in merge order)
+    def merge(self, other):
+        if other.relative_error != self.relative_error or other.max_buckets != self.max_buckets:
+            raise ValueError("Cannot merge sketches built with different error bounds or window sizes")
+        rows = self._rows_for(other.gene_ids)
+        self.counts[rows] += other.counts
+        column = np.zeros(len(self.gene_ids), dtype=np.float64)
+        column[rows] = finish_row_sum(other.total, other.compensation)
+        accumulate_column(self.total, self.compensation, column)
+        self.minimum[rows] = np.minimum(self.minimum[rows], other.minimum)
+        self.maximum[rows] = np.maximum(self.maximum[rows], other.maximum)
+
+        # Fold the other windows one column at a time; zeros are added last so that the medians steering the
+        # windows are those of the values folded so far
+        for col in range(other.buckets.shape[1]):
+            weights = other.buckets[:, col].astype(np.int64)
+            filled = weights > 0
+            if np.any(filled):
+                self._add_to_buckets(rows[filled], other.offsets[filled] + col, weights[filled])
+        self.zeros[rows] += other.zeros
+
+    # Estimate the values at 0-based ranks `ranks` of genes [first, last) from their sketches
+    # The cumulative bucket counts are built once per block of genes and shared by every rank.
+    def _values_at_ranks(self, first, last, ranks):
+        cumulative = np.cumsum(self.buckets[first:last], axis=1, dtype=np.int64)
+        offsets = np.where(self.offsets[first:last] == UNSET, 0, self.offsets[first:last])
+        gamma = math.exp(self.log_gamma)
+        values = []
+        for rank in ranks:
+            above_zero = rank - self.zeros[first:last]
+            bucket = (cumulative <= above_zero[:, None]).sum(axis=1)
+            bucket = np.minimum(bucket, self.max_buckets - 1)
+            estimate = 2 * np.exp((bucket + offsets) * self.log_gamma) / (gamma + 1)
+            estimate = np.clip(estimate, self.minimum[first:last], self.maximum[first:last])
+            values.append(np.where(above_zero < 0, 0.0, estimate))
+        return values
+
+    # Per-gene (gene IDs, means, approximate medians) of everything folded so far
+    def result(self):
+        means = finish_row_sum(self.total, self.compensation) / self.counts
+        medians = np.empty(len(self.counts))
+        for first in range(0, len(self.counts), RANK_BLOCK_GENES):
+            last = min(first + RANK_BLOCK_GENES, len(self.counts))
+            counts = self.counts[first:last]
+            lower, upper = self._values_at_ranks(first, last, [(counts - 1) // 2, counts // 2])
+            medians[first:last] = np.where(counts % 2 != 0, upper, (lower + upper) / 2)
+        return list(self.gene_ids), means, medians
+
+
+# Function to stream one directory through a StreamingExpressionSummary
+def stream_directory(directory, relative_error=0.01, workers=1, verbose=True):
+    summary = StreamingExpressionSummary(relative_error)
+    for ids, values in iter_normalized_columns(directory, workers, verbose):
+        summary.add_column(ids, values)
+    return summary.result()
@@ -0,0 +1,98 @@
+import csv
+import sys
+import numpy as np
+
+
+# Columns of a summary table, in the order of the TSV output
+SUMMARY_FIELDS = ['mean_control', 'median_control', 'mean_treatment', 'median_treatment', 'log_fold_change', 'p_value']
+
+# Header of the TSV export, matching what main() writes
+TSV_HEADER = ['#gene',
+              '(mean normalized control expression)',
+              '(median normalized control expression)',
+              '(mean normalized treatment expression)',
+              '(median normalized treatment expression)',
+              '(logFoldChange)',
+              '(p-value)']
+
+
+# Function to pack summary rows (gene, mean/median control, mean/median treatment, logFC[, p-value])
+# into one structured array with a fixed-width gene column, so it can be saved and memory-mapped
+def build_summary_table(rows):
+    n_fields = len(rows[0]) - 1 if rows else len(SUMMARY_FIELDS) - 1
+    gene_width = max((len(row[0]) for row in rows), default=1)
+    dtype = [('gene', f'U{gene_width}')] + [(name, np.float64) for name in SUMMARY_FIELDS[:n_fields]]
+    return np.array([tuple(row) for row in rows], dtype=dtype)
+
+
+# Function to write a summary table as a binary .npy file in one call
+def write_summary(path, table):
+    np.save(path, table, allow_pickle=False)
+
+
+# Function to load a binary summary; memory-mapped by default so repeated loads cost no parsing
+def load_summary(path, mmap=True):
+    return np.load(path, mmap_mode='r' if mmap else None, allow_pickle=False)
+
+
+# Function to read a TSV summary written by main() back into a summary table
+def read_summary_tsv(path):
+    with open(path, mode='r', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader)  # Skip header
+        rows = [[row[0]] + [float(value) for value in row[1:]] for row in reader if row]
+    return build_summary_table(rows)
+
+
+# Function to load a summary from either format (.npy binary or the TSV text output)
+def read_summary(path):
+    return load_summary(path) if path.endswith('.npy') else read_summary_tsv(path)
+
+
+# Function to export a summary table as the tab-delimited text output
+def export_tsv(table, path):
+    fields = [name for name in SUMMARY_FIELDS if name in table.dtype.names]
+    with open(path, mode='w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(TSV_HEADER[:len(fields) + 1])
+        genes = table['gene'].tolist()
+        columns = [table[name].tolist() for name in fields]
+        writer.writerows(zip(genes, *columns))
+
+
+# Function to compare two summary tables field by field with array operations
+# Rows are matched on gene ID; values agree when they are equal (covers +/-inf) or within
+# math.isclose's default relative tolerance; `field_tolerances` ({field: rel_tol}) loosens it per field, e.g. for
+# the approximate medians of streaming mode. Returns (genes missing from `expected`,
+# {field: boolean mismatch array over the matched rows}, matched gene IDs, observed rows, expected rows).
+def compare_summaries(observed, expected, rel_tol=1e-09, field_tolerances=None):
+    expected_index = {gene: i for i, gene in enumerate(expected['gene'].tolist())}
+    observed_genes = observed['gene'].tolist()
+    matched = [i for i, gene in enumerate(observed_genes) if gene in expected_index]
+    missing = [gene for gene in observed_genes if gene not in expected_index]
+
+    observed_rows = np.array(matched, dtype=np.intp)
+    expected_rows = np.array([expected_index[observed_genes[i]] for i in matched], dtype=np.intp)
+
+    mismatches = {}
+    for name in SUMMARY_FIELDS:
+        if name not in observed.dtype.names or name not in expected.dtype.names:
+            continue
+        a = np.asarray(observed[name])[observed_rows]
+        b = np.asarray(expected[name])[expected_rows]
+        tolerance = (field_tolerances or {}).get(name, rel_tol)
+        with np.errstate(invalid='ignore'):
+            close = (a == b) | (np.isfinite(a) & np.isfinite(b)
+                                & (np.abs(a - b) <= tolerance * np.maximum(np.abs(a), np.abs(b))))
+        mismatches[name] = ~close
+
+    genes = [observed_genes[i] for i in matched]
+    return missing, mismatches, genes, observed_rows, expected_rows
+
+
+if __name__ == '__main__':
+    # Convert a binary summary to the TSV export: python expression_summary.py summary.npy output.txt
+    if len(sys.argv) < 3:
+        print("Usage: python expression_summary.py path/to/summary.npy path/to/output.txt")
+        sys.exit(1)
+    export_tsv(load_summary(sys.argv[1]), sys.argv[2])
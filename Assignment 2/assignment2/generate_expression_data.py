@@ -0,0 +1,61 @@
+import argparse
+import os
+import numpy as np
+
+
+# Function to write one experiment CSV in the same layout as the course data (Gene,Expression_Level)
+def write_experiment(path, gene_ids, values):
+    with open(path, mode='w') as f:
+        f.write('Gene,Expression_Level\n')
+        f.write('\n'.join(f'{gene_id},{value!r}' for gene_id, value in zip(gene_ids, values.tolist())))
+        f.write('\n')
+
+
+# Function to generate a synthetic control/treatment dataset
+# Expression levels are gamma-Poisson (negative binomial) draws around a per-gene base level.
+# `de_fraction` of the genes are shifted by `fold_change` in the treatment group, `dropout` is the
+# chance that a measurement is zeroed, and `tie_fraction` of the genes take values from a small
+# discrete set so the rank test sees ties. Returns the control and treatment directory paths.
+def generate_dataset(directory, n_genes=1000, n_files=10, dropout=0.0, tie_fraction=0.0, de_fraction=0.1,
+                     fold_change=2.0, seed=0):
+    rng = np.random.default_rng(seed)
+    gene_ids = [f'Gene{i + 1}' for i in range(n_genes)]
+    base = rng.lognormal(mean=3.0, sigma=1.5, size=n_genes)
+    shift = np.ones(n_genes)
+    shift[rng.random(n_genes) < de_fraction] = fold_change
+    tied = rng.random(n_genes) < tie_fraction
+
+    paths = []
+    for group, level in (('control_files', base), ('treatment_files', base * shift)):
+        group_dir = os.path.join(directory, group)
+        os.makedirs(group_dir, exist_ok=True)
+        for i in range(n_files):
+            values = rng.poisson(rng.gamma(shape=5.0, scale=level / 5.0)).astype(np.float64)
+            values += rng.random(n_genes)  # Continuous jitter so untied genes have no ties
+            values[tied] = np.floor(values[tied] / 10)  # Coarse integer levels for the tied genes
+            values[rng.random(n_genes) < dropout] = 0.0
+            write_experiment(os.path.join(group_dir, f'experiment_{i + 1}.csv'), gene_ids, values)
+        paths.append(group_dir)
+
+    return paths[0], paths[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic control/treatment expression directories.")
+    parser.add_argument('directory', help="Output directory (control_files/ and treatment_files/ are created)")
+    parser.add_argument('--genes', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--dropout', type=float, default=0.0, help="Fraction of measurements set to zero")
+    parser.add_argument('--ties', type=float, default=0.0, help="Fraction of genes with tied values")
+    parser.add_argument('--de-fraction', type=float, default=0.1, help="Fraction of differentially expressed genes")
+    parser.add_argument('--fold-change', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    control_dir, treatment_dir = generate_dataset(args.directory, args.genes, args.files, args.dropout, args.ties,
+                                                  args.de_fraction, args.fold_change, args.seed)
+    print(f"Wrote {args.files} files x {args.genes} genes to {control_dir} and {treatment_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import numpy as np
+from expression_stream import StreamingExpressionSummary
+
+
+# Function to fold single-gene values into a sketch one file at a time and return the approximate median
+def sketch_median(values, relative_error=0.01, **options):
+    summary = StreamingExpressionSummary(relative_error, **options)
+    for value in values:
+        summary.add_column(['GeneA'], np.array([value]))
+    return summary.result()[2][0]
+
+
+# A high first value must not push later, much smaller values out of the window
+def test_median_of_multi_decade_input_with_high_first_value():
+    values = [1.0] + list(np.linspace(1e-4, 1.2e-4, 20))
+    exact = np.median(values)
+    assert abs(sketch_median(values) - exact) <= 0.01 * exact
+
+
+# The median stays within the error bound when the values span more than the window and collapse is needed
+def test_median_when_values_outgrow_the_window():
+    values = [1.0] + list(np.linspace(1e-4, 1.2e-4, 20))
+    exact = np.median(values)
+    assert abs(sketch_median(values, max_buckets=64) - exact) <= 0.01 * exact
+
+
+# Two clusters two decades apart, as in control files where a gene is nearly silent in most experiments
+def test_median_of_two_clusters_in_any_order():
+    rng = np.random.default_rng(0)
+    values = np.array([1e-4] * 6 + [0.02] * 5)
+    for _ in range(20):
+        order = rng.permutation(values)
+        assert abs(sketch_median(order) - 1e-4) <= 0.01 * 1e-4
+
+
+# Random inputs spanning eight decades, with zeros, stay within the relative error
+def test_median_within_relative_error_over_eight_decades():
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        values = np.exp(rng.uniform(np.log(1e-8), 0, size=rng.integers(1, 40)))
+        values[rng.random(len(values)) < 0.1] = 0
+        exact = np.median(values)
+        assert abs(sketch_median(values, 0.02) - exact) <= 0.02 * exact
+
+
+# Merging two sketches gives the median of all the values
+def test_merged_sketches():
+    rng = np.random.default_rng(2)
+    values = np.exp(rng.uniform(-10, 0, size=(40, 50)))
+    genes = [f'Gene{i}' for i in range(50)]
+    first, second = StreamingExpressionSummary(), StreamingExpressionSummary()
+    for column in values[:20]:
+        first.add_column(genes, column)
+    for column in values[20:]:
+        second.add_column(genes, column)
+    first.merge(second)
+    exact = np.median(values, axis=0)
+    assert np.all(np.abs(first.result()[2] - exact) <= 0.01 * exact)
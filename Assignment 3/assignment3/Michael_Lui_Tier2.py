@@ -1,121 +1,137 @@
+import argparse
 import numpy as np
 import sys
-from collections import defaultdict
+from analytic_overlap import analytic_test
+from bed_reader import read_bed, read_fai
+from interval_arrays import as_interval_arrays, sort_intervals, merge_intervals, count_overlap
+from interval_index import IntervalIndex, is_interval_index, count_overlap_index
+from interval_shuffle import AllowedSpaceShuffle
+from null_cache import NullDistributionCache
+from permutation_null import cached_exceedances, permutation_p_value, p_value_interval
 
 def load_bed(file_path):
-    ranges = defaultdict(list)
-    with open(file_path, 'r') as bed_file:
-        for line in bed_file:
-            chrom, start, end = line.strip().split()[:3]
-            ranges[chrom].append((int(start), int(end)))
-    return ranges
+    # Plain or gzip BED, read in blocks; track/browser/# lines are skipped (see bed_reader.py)
+    # Stored per chromosome as sorted int64 (starts, ends) arrays
+    return read_bed(file_path)
 
 def load_fai(file_path):
-    chrom_sizes = {}
-    with open(file_path, 'r') as fai_file:
-        for line in fai_file:
-            chrom, size = line.strip().split()[:2]
-            chrom_sizes[chrom] = int(size)
-    return chrom_sizes
+    return read_fai(file_path)
+
+def load_bed_or_index(path):
+    # A prebuilt interval index (see interval_index.py) is memory-mapped instead of parsed and merged
+    return IntervalIndex(path) if is_interval_index(path) else load_bed(path)
 
 def merge_ranges(ranges):
-    merged = defaultdict(list)
-    for chrom, chrom_ranges in ranges.items():
-        if not chrom_ranges:
-            continue
-        sorted_ranges = sorted(chrom_ranges)
-        current_start, current_end = sorted_ranges[0]
-
-        for start, end in sorted_ranges[1:]:
-            if start <= current_end:
-                current_end = max(current_end, end)
-            else:
-                merged[chrom].append((current_start, current_end))
-                current_start, current_end = start, end
-        merged[chrom].append((current_start, current_end))
-    return merged
+    if isinstance(ranges, IntervalIndex):
+        return ranges  # Already merged
+    return merge_intervals(as_interval_arrays(ranges))
 
 def count_overlapping_bases(setA, setB):
-    overlap_count = 0
-    for chrom in setA:
-        if chrom in setB:
-            a_ranges = setA[chrom]
-            b_ranges = setB[chrom]
-
-            i, j = 0, 0
-            a_ranges = sorted(a_ranges)  # Ensure ranges are sorted
-            b_ranges = sorted(b_ranges)
-
-            while i < len(a_ranges) and j < len(b_ranges):
-                a_start, a_end = a_ranges[i]
-                b_start, b_end = b_ranges[j]
-
-                if a_end <= b_start:
-                    i += 1
-                elif b_end <= a_start:
-                    j += 1
-                else:
-                    overlap_start = max(a_start, b_start)
-                    overlap_end = min(a_end, b_end)
-                    overlap_count += max(0, overlap_end - overlap_start)
-
-                    if a_end < b_end:
-                        i += 1
-                    else:
-                        j += 1
-    return overlap_count
+    # Each interval of setA contributes the bases of (merged) setB that it covers
+    if isinstance(setB, IntervalIndex):
+        return count_overlap_index(as_interval_arrays(setA), setB)
+    return count_overlap(as_interval_arrays(setA), as_interval_arrays(setB))
 
 def randomize_bed(set_ranges, chrom_sizes):
-    randomized = defaultdict(list)
+    randomized = {}
 
-    for chrom, ranges in set_ranges.items():
+    for chrom, (starts, ends) in as_interval_arrays(set_ranges).items():
         max_pos = chrom_sizes.get(chrom, 0)
-        if not ranges or max_pos == 0:
+        if len(starts) == 0 or max_pos == 0:
             continue
         
-        # Create an array for lengths and preallocate starts
-        range_lengths = np.array([end - start for start, end in ranges])
+        # Create an array for lengths and draw all starts at once
+        range_lengths = ends - starts
         total_length = np.sum(range_lengths)
-        starts = np.random.randint(0, max_pos - total_length + 1, size=len(ranges))
+        new_starts = np.random.randint(0, max_pos - total_length + 1, size=len(starts))
 
         # Create randomized ranges
-        for start, length in zip(starts, range_lengths):
-            randomized[chrom].append((start, start + length))
+        randomized[chrom] = sort_intervals(new_starts, new_starts + range_lengths)
 
     return randomized
 
-def permutation_test(setA, setB, chrom_sizes, num_permutations=10000):
-    merged_setA = merge_ranges(setA)
-    merged_setB = merge_ranges(setB)
-    observed_overlap = count_overlapping_bases(merged_setA, merged_setB)
+def start_bounds(set_ranges, chrom_sizes):
+    # Exclusive upper bound of each range's random start, as used by randomize_bed
+    bounds = {}
+    for chrom, (starts, ends) in as_interval_arrays(set_ranges).items():
+        max_pos = chrom_sizes.get(chrom, 0)
+        if len(starts) == 0 or max_pos == 0:
+            continue
+        total_length = np.sum(ends - starts)
+        bounds[chrom] = np.full(len(starts), max_pos - total_length + 1)
+    return bounds
 
-    random_overlaps = np.zeros(num_permutations, dtype=int)
-    
-    for i in range(num_permutations):
-        randomized_setA = randomize_bed(merged_setA, chrom_sizes)
-        random_overlaps[i] = count_overlapping_bases(randomized_setA, merged_setB)
-    
-    p_value = (np.sum(random_overlaps >= observed_overlap) + 1) / (num_permutations + 1)
-    
+def permutation_test(setA, setB, chrom_sizes, num_permutations=10000, workers=1, seed=None):
+    observed_overlap, p_value, _, _ = adaptive_permutation_test(setA, setB, chrom_sizes, num_permutations,
+                                                                workers=workers, seed=seed)
     return observed_overlap, p_value
 
-def main():
-    if len(sys.argv) < 4:
-        print("Usage: python submission.py path/to/SetA.bed path/to/SetB.bed path/to/genome.fa.fai [num_permutations]")
-        sys.exit(1)
-
-    setA_file = sys.argv[1]
-    setB_file = sys.argv[2]
-    fai_file = sys.argv[3]
-    num_permutations = int(sys.argv[4]) if len(sys.argv) > 4 else 10000
-
-    setA = load_bed(setA_file)
-    setB = load_bed(setB_file)
-    chrom_sizes = load_fai(fai_file)
+def adaptive_permutation_test(setA, setB, chrom_sizes, num_permutations=10000, early_stop=None, workers=1,
+                              seed=None, exclusions=None, no_overlap=False, null_cache=None):
+    merged_setA = merge_ranges(setA)
+    merged_setB = merge_ranges(setB)
+    observed_overlap = count_overlapping_bases(merged_setA, merged_setB)
 
-    observed_overlap, p_value = permutation_test(setA, setB, chrom_sizes, num_permutations)
+    # Excluded regions or non-overlapping placement switch to the allowed-space shuffle (interval_shuffle.py)
+    if exclusions is not None or no_overlap:
+        placement = AllowedSpaceShuffle(merged_setA, chrom_sizes, exclusions, no_overlap)
+    else:
+        placement = start_bounds(merged_setA, chrom_sizes)
+
+    # Whole blocks of permutations are drawn and scored with array operations (see permutation_null.py);
+    # the null depends only on the seed, not on the number of workers. With early_stop, sampling ends once
+    # that many random overlaps reach the observed one (Besag-Clifford), capped at num_permutations.
+    # Seeded nulls are reused from null_cache when the same SetB, genome and SetA length profile were seen before.
+    exceed, used = cached_exceedances(merged_setA, merged_setB, chrom_sizes, placement, observed_overlap,
+                                      num_permutations, early_stop, seed, workers, null_cache)
+
+    p_value = permutation_p_value(exceed, used, early_stop)
+
+    return observed_overlap, p_value, used, p_value_interval(exceed, used)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Permutation test for overlapping bases between two BED files.")
+    parser.add_argument('setA_file', help="path/to/SetA.bed")
+    parser.add_argument('setB_file', help="path/to/SetB.bed, or an index built by interval_index.py")
+    parser.add_argument('fai_file', help="path/to/genome.fa.fai")
+    parser.add_argument('num_permutations', type=int, nargs='?', default=10000)
+    # Worker processes for the permutations; with --seed the result is the same for any worker count
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    # Stop once this many random overlaps reach the observed one; num_permutations becomes the cap
+    parser.add_argument('--early-stop', type=int, default=None)
+    # Shuffle only into the genome minus these regions (gaps, blacklists), and/or without overlapping ranges
+    parser.add_argument('--exclude', default=None, help="BED file of regions ranges may not be placed in")
+    parser.add_argument('--no-overlap', action='store_true')
+    # Triage mode: normal approximation of the uniform-placement null, no permutations (see analytic_overlap.py)
+    parser.add_argument('--method', choices=['permutation', 'analytic'], default='permutation')
+    # Directory of stored null distributions for seeded runs, trimmed to --null-cache-mb
+    parser.add_argument('--null-cache', default=None)
+    parser.add_argument('--null-cache-mb', type=int, default=256)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    setA = load_bed(args.setA_file)
+    setB = load_bed_or_index(args.setB_file)
+    chrom_sizes = load_fai(args.fai_file)
+    exclusions = load_bed(args.exclude) if args.exclude else None
+    null_cache = NullDistributionCache(args.null_cache, args.null_cache_mb * 2 ** 20) if args.null_cache else None
+
+    if args.method == 'analytic':
+        observed_overlap, p_value, _, _ = analytic_test(setA, setB, chrom_sizes)
+        print(f"Number of overlapping bases observed: {observed_overlap}, p value: {p_value:.4f}")
+        return
+
+    observed_overlap, p_value, used, (low, high) = adaptive_permutation_test(setA, setB, chrom_sizes,
+                                                                             args.num_permutations, args.early_stop,
+                                                                             args.workers, args.seed, exclusions,
+                                                                             args.no_overlap, null_cache)
 
     print(f"Number of overlapping bases observed: {observed_overlap}, p value: {p_value:.4f}")
+    if args.early_stop is not None:
+        print(f"Permutations used: {used}, 95% CI for p: [{low:.4g}, {high:.4g}]")
 
 def self_test():
     setA = {"chr1": [(10, 15), (13, 18), (20, 25)], "chr2": [(30, 40)]}
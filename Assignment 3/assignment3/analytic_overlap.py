@@ -0,0 +1,98 @@
+import argparse
+from statistics import NormalDist
+import numpy as np
+from bed_reader import read_bed, read_fai
+from interval_arrays import as_interval_arrays, merge_intervals, count_overlap
+from interval_shuffle import AllowedSpaceShuffle
+from permutation_null import parallel_permuted_overlaps
+
+
+# Function to sum g(L, l) over every target length l for each query length L, where g(L, l) counts the pairs of
+# bases shared by a window of length L and a target interval of length l over all relative shifts:
+# g = L l^2 - l^3/3 + l/3 when l <= L, and the same with L and l swapped when l > L.
+def shift_pair_sums(query_lengths, target_lengths):
+    lengths = np.sort(target_lengths).astype(np.float64)
+    prefix = [np.concatenate([[0.0], np.cumsum(lengths ** power)]) for power in (1, 2, 3)]
+    L = query_lengths.astype(np.float64)
+    k = np.searchsorted(lengths, L, side='right')  # Targets no longer than L
+    shorter = L * prefix[1][k] - prefix[2][k] / 3 + prefix[0][k] / 3
+    longer = (prefix[0][-1] - prefix[0][k]) * L ** 2 + (len(lengths) - k) * (L / 3 - L ** 3 / 3)
+    return shorter + longer
+
+
+# Function to compute the null mean and variance of overlapping bases when every merged query interval is placed
+# uniformly and independently on its chromosome (the Tier 1 / allowed-space null without exclusions)
+# An interval of length L on a chromosome of size G with covered fraction f overlaps L f bases on average; its
+# second moment comes from the target's self-overlap at every shift (shift_pair_sums). Edge effects and pairs of
+# target intervals closer than L are ignored, which is accurate when intervals are small next to the chromosome.
+def overlap_moments(query, target, chrom_sizes):
+    query, target = merge_intervals(as_interval_arrays(query)), merge_intervals(as_interval_arrays(target))
+    mean = variance = 0.0
+    for chrom, (starts, ends) in query.items():
+        size = chrom_sizes.get(chrom, 0)
+        if chrom not in target or size == 0:
+            continue
+        query_lengths = ends - starts
+        target_lengths = target[chrom][1] - target[chrom][0]
+        interval_mean = query_lengths * (target_lengths.sum() / size)
+        second_moment = shift_pair_sums(query_lengths, target_lengths) / size
+        mean += interval_mean.sum()
+        variance += (second_moment - interval_mean ** 2).sum()
+    return mean, max(variance, 0.0)
+
+
+# Function to turn an observed overlap into a one-sided normal-approximation p-value (with continuity correction)
+def analytic_p_value(observed, mean, variance):
+    if variance == 0:
+        return 1.0 if observed <= mean else 0.0
+    return 1 - NormalDist(mean, variance ** 0.5).cdf(observed - 0.5)
+
+
+# Function to run the analytic test: (observed overlap, p-value, null mean, null standard deviation)
+def analytic_test(setA, setB, chrom_sizes):
+    merged_setA, merged_setB = merge_intervals(as_interval_arrays(setA)), merge_intervals(as_interval_arrays(setB))
+    observed = count_overlap(merged_setA, merged_setB)
+    mean, variance = overlap_moments(merged_setA, merged_setB, chrom_sizes)
+    return observed, analytic_p_value(observed, mean, variance), mean, variance ** 0.5
+
+
+# Function to compare the analytic null with a permutation null for sample (SetA, SetB) pairs
+# The permutations use the same model (uniform placement per chromosome, overlaps allowed). Returns one dict per
+# pair with both means, standard deviations and p-values, so the fast mode can be checked before it is trusted.
+def calibrate(pairs, chrom_sizes, num_permutations=2000, seed=None, workers=1):
+    rows = []
+    for setA_file, setB_file in pairs:
+        setA, setB = merge_intervals(read_bed(setA_file)), merge_intervals(read_bed(setB_file))
+        observed, p_value, mean, sd = analytic_test(setA, setB, chrom_sizes)
+        null = parallel_permuted_overlaps(setA, setB, AllowedSpaceShuffle(setA, chrom_sizes), num_permutations,
+                                          seed, workers)
+        rows.append({'setA': setA_file, 'setB': setB_file, 'observed': observed,
+                     'analytic_mean': mean, 'analytic_sd': sd, 'analytic_p': p_value,
+                     'permutation_mean': float(null.mean()), 'permutation_sd': float(null.std()),
+                     'permutation_p': float(((null >= observed).sum() + 1) / (num_permutations + 1))})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the analytic overlap p-value against permutations.")
+    parser.add_argument('fai_file', help="path/to/genome.fa.fai")
+    parser.add_argument('bed_files', nargs='+', help="SetA.bed SetB.bed [SetA.bed SetB.bed ...]")
+    parser.add_argument('--permutations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    if len(args.bed_files) % 2:
+        parser.error("BED files must come in SetA/SetB pairs")
+
+    pairs = list(zip(args.bed_files[::2], args.bed_files[1::2]))
+    rows = calibrate(pairs, read_fai(args.fai_file), args.permutations, args.seed, args.workers)
+    print('\t'.join(['#setA', 'setB', 'observed', 'analytic_mean', 'permutation_mean', 'analytic_sd',
+                     'permutation_sd', 'analytic_p', 'permutation_p']))
+    for row in rows:
+        print(f"{row['setA']}\t{row['setB']}\t{row['observed']}\t{row['analytic_mean']:.1f}\t"
+              f"{row['permutation_mean']:.1f}\t{row['analytic_sd']:.1f}\t{row['permutation_sd']:.1f}\t"
+              f"{row['analytic_p']:.4g}\t{row['permutation_p']:.4g}")
+
+
+if __name__ == '__main__':
+    main()
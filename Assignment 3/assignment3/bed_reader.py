@@ -0,0 +1,134 @@
+import gzip
+import numpy as np
+
+
+# Default number of bytes read per block
+DEFAULT_BLOCK_SIZE = 1 << 22
+
+# First words of BED header lines
+HEADER_WORDS = (b'track', b'browser')
+
+# Bytes that separate fields: tab, space, carriage return and newline
+SEPARATORS = np.zeros(256, dtype=bool)
+SEPARATORS[[9, 10, 13, 32]] = True
+
+
+# Function to open a plain or gzip-compressed BED file for binary reading (gzip is detected by its magic bytes)
+def open_bed(path):
+    with open(path, mode='rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, mode='rb') if compressed else open(path, mode='rb')
+
+
+# Function to read a BED file in large blocks that each end on a line boundary
+def iter_bed_blocks(path, block_size=DEFAULT_BLOCK_SIZE):
+    with open_bed(path) as f:
+        rest = b''
+        for block in iter(lambda: f.read(block_size), b''):
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            if cut:
+                rest = block[cut:]
+                yield block[:cut]
+            else:
+                rest = block  # A line longer than one block; keep reading
+        if rest:
+            yield rest
+
+
+# Function to gather fields of a byte buffer into an (n_fields x width) byte matrix
+# Fields are right-aligned when `right` is set (for digits) and left-aligned otherwise; padding bytes are 0.
+def field_bytes(buf, field_starts, field_ends, right=False):
+    width = int((field_ends - field_starts).max()) if len(field_starts) else 1
+    if right:
+        index = field_ends[:, None] - width + np.arange(width)
+    else:
+        index = field_starts[:, None] + np.arange(width)
+    inside = (index >= field_starts[:, None]) & (index < field_ends[:, None])
+    return np.where(inside, buf[np.clip(index, 0, len(buf) - 1)], 0).astype(np.uint8), inside
+
+
+# Function to turn right-aligned digit fields into integers; raises ValueError on anything but digits
+def parse_integers(buf, field_starts, field_ends):
+    digits, inside = field_bytes(buf, field_starts, field_ends, right=True)
+    digits = digits.astype(np.int64) - ord('0')
+    if ((digits < 0) | (digits > 9))[inside].any():
+        raise ValueError("BED start and end columns must be non-negative integers")
+    powers = 10 ** np.arange(digits.shape[1] - 1, -1, -1, dtype=np.int64)
+    return np.where(inside, digits, 0) @ powers
+
+
+# Function to parse one block into chromosome names and start/end arrays in bulk
+# The block is viewed as a byte array: field boundaries, line numbers, chromosome names and coordinates are all
+# found with array operations, so no Python object is made per record. Blank lines, lines with fewer than three
+# fields, and track/browser/# header lines are skipped.
+def parse_bed_block(block, dtype=np.int64):
+    if not block.endswith(b'\n'):
+        block += b'\n'
+    buf = np.frombuffer(block, dtype=np.uint8)
+    separator = SEPARATORS[buf]
+    field = ~separator
+    field_starts = np.flatnonzero(field[1:] & separator[:-1]) + 1
+    if field[0]:
+        field_starts = np.append(0, field_starts)
+    field_ends = np.flatnonzero(field[:-1] & separator[1:]) + 1  # The block always ends in a newline
+
+    # Line of each field, and the first field of every line that has one
+    line = np.searchsorted(np.flatnonzero(buf == ord('\n')), field_starts)
+    first = np.flatnonzero(np.concatenate([[True], line[1:] != line[:-1]])) if len(line) else line
+    n_fields = np.diff(np.append(first, len(line)))
+    first = first[(n_fields >= 3) & (buf[field_starts[first]] != ord('#'))]
+
+    chroms = field_bytes(buf, field_starts[first], field_ends[first])[0]
+    chroms = np.ascontiguousarray(chroms).view(f'S{chroms.shape[1]}').ravel()
+    record = ~np.isin(chroms, HEADER_WORDS)
+    chroms, first = chroms[record], first[record]
+
+    starts = parse_integers(buf, field_starts[first + 1], field_ends[first + 1])
+    ends = parse_integers(buf, field_starts[first + 2], field_ends[first + 2])
+    if len(ends) and ends.max() > np.iinfo(dtype).max:
+        raise ValueError(f"BED coordinate {ends.max()} does not fit in {np.dtype(dtype).name}")
+    return chroms, starts.astype(dtype), ends.astype(dtype)
+
+
+# Function to split one parsed block into {chrom: (starts, ends)} without a Python object per record
+# Chromosomes keep the order in which they first appear in the file.
+def group_by_chrom(chroms, starts, ends):
+    names, first, codes = np.unique(chroms, return_index=True, return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    return {names[i].decode(): (starts[order[bounds[i]:bounds[i + 1]]], ends[order[bounds[i]:bounds[i + 1]]])
+            for i in np.argsort(first)}
+
+
+# Function to stream a BED file as (chrom, starts, ends) chunks, one per chromosome per block
+# Memory stays bounded by the block size, so files larger than RAM can be processed chunk by chunk.
+# Coordinates default to int32 (4 bytes each); a coordinate that does not fit raises ValueError.
+def iter_bed_chunks(path, dtype=np.int32, block_size=DEFAULT_BLOCK_SIZE):
+    for block in iter_bed_blocks(path, block_size):
+        for chrom, (starts, ends) in group_by_chrom(*parse_bed_block(block, dtype)).items():
+            yield chrom, starts, ends
+
+
+# Function to read a whole plain or gzip BED file into {chrom: (starts, ends)} sorted by start, then end
+def read_bed(path, dtype=np.int64, block_size=DEFAULT_BLOCK_SIZE):
+    chunks = {}
+    for chrom, starts, ends in iter_bed_chunks(path, dtype, block_size):
+        chunks.setdefault(chrom, []).append((starts, ends))
+    intervals = {}
+    for chrom, parts in chunks.items():
+        starts = np.concatenate([part[0] for part in parts])
+        ends = np.concatenate([part[1] for part in parts])
+        order = np.lexsort((ends, starts))
+        intervals[chrom] = starts[order], ends[order]
+    return intervals
+
+
+# Function to read chromosome sizes from a FASTA index (.fai): {chrom: length}
+def read_fai(path):
+    chrom_sizes = {}
+    with open(path, 'r') as fai_file:
+        for line in fai_file:
+            chrom, size = line.strip().split()[:2]
+            chrom_sizes[chrom] = int(size)
+    return chrom_sizes
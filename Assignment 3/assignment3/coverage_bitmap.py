@@ -0,0 +1,66 @@
+import numpy as np
+
+
+# Largest bitmap (packed bits plus per-word ranks) built for one chromosome, in bytes
+BITMAP_MAX_BYTES = 16 * 2 ** 20
+
+# Fewest merged intervals for which a bitmap lookup beats the binary search over interval arrays
+BITMAP_MIN_INTERVALS = 64
+
+# Bytes per 64-base word: 8 for the packed bits and 8 for the running rank
+BYTES_PER_WORD = 16
+
+# Transient bytes per word while a bitmap is built: the int8 fill marks, their running sum and the full-word mask
+BUILD_BYTES_PER_WORD = 3
+
+# Word with every bit set
+ALL_BITS = np.uint64(2 ** 64 - 1)
+
+
+# Function to decide whether a merged chromosome is better served by a bitmap than by sorted interval arrays
+# The bitmap costs memory in proportion to the chromosome span but answers each lookup in constant time, so it is
+# used for compact spans with many intervals; sparse annotations on long chromosomes keep the interval path.
+def use_bitmap(starts, ends, max_bytes=BITMAP_MAX_BYTES):
+    if len(starts) < BITMAP_MIN_INTERVALS:
+        return False
+    return (int(ends[-1]) // 64 + 2) * (BYTES_PER_WORD + BUILD_BYTES_PER_WORD) <= max_bytes
+
+
+# Merged intervals of one chromosome as packed uint64 coverage bits with a running popcount per word
+# Bases covered before position x = rank[x // 64] + popcount(word[x // 64] & low (x % 64) bits), so an interval's
+# overlap is two gathers and two popcounts, with no search.
+# Words are set straight from the intervals: shifted masks for the words holding an interval's two ends and whole
+# words in between, so building takes BUILD_BYTES_PER_WORD transient bytes per word rather than bytes per base.
+class CoverageBitmap:
+    def __init__(self, starts, ends):
+        n_words = int(ends[-1]) // 64 + 2 if len(ends) else 1  # One spare word past the last end
+        self.limit = (n_words - 1) * 64
+        starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+        first_word, last_word = starts >> 6, ends >> 6
+        head = ALL_BITS << (starts & 63).astype(np.uint64)  # Bits from the start to the end of its word
+        tail = (np.uint64(1) << (ends & 63).astype(np.uint64)) - np.uint64(1)  # Bits before the end in its word
+        same = first_word == last_word
+
+        self.words = np.zeros(n_words, dtype=np.uint64)
+        fill = np.zeros(n_words + 1, dtype=np.int8)
+        np.add.at(fill, first_word[~same] + 1, 1)
+        np.add.at(fill, last_word[~same], -1)
+        np.copyto(self.words, ALL_BITS, where=np.cumsum(fill[:-1], dtype=np.int8) > 0)
+        del fill
+        np.bitwise_or.at(self.words, first_word, np.where(same, head & tail, head))
+        np.bitwise_or.at(self.words, last_word[~same], tail[~same])
+
+        self.rank = np.zeros(n_words + 1, dtype=np.int64)
+        self.rank[1:] = np.bitwise_count(self.words)
+        np.cumsum(self.rank[1:], out=self.rank[1:])  # In place, so no int64 copy of the counts
+
+    # Number of covered bases before each position
+    def covered_before(self, positions):
+        positions = np.clip(positions, 0, self.limit)
+        word = positions >> 6
+        mask = (np.uint64(1) << (positions & 63).astype(np.uint64)) - np.uint64(1)
+        return self.rank[word] + np.bitwise_count(self.words[word] & mask)
+
+    # Covered bases inside each query interval
+    def overlap(self, query_starts, query_ends):
+        return self.covered_before(query_ends) - self.covered_before(query_starts)
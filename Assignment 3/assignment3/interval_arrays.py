@@ -0,0 +1,83 @@
+import numpy as np
+
+
+# Intervals are stored per chromosome as a (starts, ends) pair of int64 arrays, sorted by start
+# then end. A merged set has no overlapping or touching intervals.
+
+
+# Function to sort one chromosome's intervals by start, then end
+def sort_intervals(starts, ends):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    order = np.lexsort((ends, starts))
+    return starts[order], ends[order]
+
+
+# Function to turn {chrom: [(start, end), ...]} (or already-array sets) into sorted interval arrays
+def as_interval_arrays(ranges):
+    intervals = {}
+    for chrom, chrom_ranges in ranges.items():
+        if isinstance(chrom_ranges, tuple) and len(chrom_ranges) == 2 and isinstance(chrom_ranges[0], np.ndarray):
+            intervals[chrom] = chrom_ranges
+            continue
+        pairs = np.asarray(list(chrom_ranges), dtype=np.int64).reshape(-1, 2)
+        intervals[chrom] = sort_intervals(pairs[:, 0], pairs[:, 1])
+    return intervals
+
+
+# Function to merge one chromosome's sorted intervals; touching intervals (start == previous end) are joined
+def merge_sorted_intervals(starts, ends):
+    if len(starts) == 0:
+        return starts, ends
+    # Running maximum end of everything seen so far; a new block starts where a start passes it
+    reach = np.maximum.accumulate(ends)
+    new_block = np.empty(len(starts), dtype=bool)
+    new_block[0] = True
+    new_block[1:] = starts[1:] > reach[:-1]
+    first = np.flatnonzero(new_block)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+    return starts[first], reach[last]
+
+
+# Function to merge every chromosome of an interval set
+def merge_intervals(intervals):
+    return {chrom: merge_sorted_intervals(starts, ends) for chrom, (starts, ends) in intervals.items()
+            if len(starts)}
+
+
+# Function to build the cumulative coverage of a merged chromosome: covered[k] = bases in intervals before k
+def cumulative_coverage(starts, ends):
+    return np.concatenate([[0], np.cumsum(ends - starts)])
+
+
+# Function to count the bases of a merged set that fall before each position (vectorized over positions)
+def covered_before(positions, starts, ends, covered):
+    k = np.searchsorted(starts, positions, side='right') - 1
+    return covered_at(k, positions, starts, ends, covered)
+
+
+# Function to count covered bases before each position, given k = index of the last interval starting at or before it
+def covered_at(k, positions, starts, ends, covered):
+    inside = np.where(k >= 0, np.minimum(positions, ends[np.maximum(k, 0)]) - starts[np.maximum(k, 0)], 0)
+    return np.where(k >= 0, covered[np.maximum(k, 0)] + np.maximum(inside, 0), 0)
+
+
+# Function to count, for each query interval, the bases it shares with a merged set
+def overlap_per_interval(query_starts, query_ends, starts, ends, covered=None):
+    if len(starts) == 0:
+        return np.zeros(np.shape(query_starts), dtype=np.int64)
+    if covered is None:
+        covered = cumulative_coverage(starts, ends)
+    return covered_before(query_ends, starts, ends, covered) - covered_before(query_starts, starts, ends, covered)
+
+
+# Function to count overlapping bases between a query set and a target set, chromosome by chromosome
+# Each query interval contributes the bases of the merged target it covers.
+def count_overlap(query, target):
+    total = 0
+    for chrom, (query_starts, query_ends) in query.items():
+        if chrom not in target or len(query_starts) == 0:
+            continue
+        starts, ends = merge_sorted_intervals(*target[chrom])
+        total += int(overlap_per_interval(query_starts, query_ends, starts, ends).sum())
+    return total
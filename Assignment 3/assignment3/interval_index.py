@@ -0,0 +1,134 @@
+import json
+import os
+import sys
+import numpy as np
+from bed_reader import read_bed
+from interval_arrays import as_interval_arrays, merge_intervals, cumulative_coverage, covered_at
+
+
+# Default bin width of the lookup table, as a power of two (2 ** 14 = 16 kb)
+DEFAULT_BIN_SHIFT = 14
+
+
+# Function to write a merged interval set as a memory-mappable index directory
+# Layout: starts.npy, ends.npy and covered.npy hold every chromosome's merged intervals and cumulative
+# coverage back to back; bins.npy holds, per chromosome, the number of intervals starting before each
+# bin edge; index.json records the slice of each array that belongs to each chromosome.
+def build_interval_index(ranges, path, bin_shift=DEFAULT_BIN_SHIFT):
+    merged = merge_intervals(as_interval_arrays(ranges))
+    os.makedirs(path, exist_ok=True)
+
+    chroms, starts, ends, covered, bins = [], [], [], [], []
+    offsets = {'intervals': 0, 'covered': 0, 'bins': 0}
+    for chrom, (chrom_starts, chrom_ends) in merged.items():
+        # Last edge lies past every start, so its entry is the interval count
+        edges = np.arange((int(chrom_starts[-1]) >> bin_shift) + 2, dtype=np.int64) << bin_shift
+        chrom_bins = np.searchsorted(chrom_starts, edges, side='left')
+        chroms.append({'name': chrom, 'count': len(chrom_starts), 'bin_count': len(chrom_bins),
+                       'interval_offset': offsets['intervals'], 'covered_offset': offsets['covered'],
+                       'bin_offset': offsets['bins'], 'max_bin_width': int(np.diff(chrom_bins).max())})
+        starts.append(chrom_starts)
+        ends.append(chrom_ends)
+        covered.append(cumulative_coverage(chrom_starts, chrom_ends))
+        bins.append(chrom_bins.astype(np.int64))
+        offsets['intervals'] += len(chrom_starts)
+        offsets['covered'] += len(chrom_starts) + 1
+        offsets['bins'] += len(chrom_bins)
+
+    for name, arrays in (('starts', starts), ('ends', ends), ('covered', covered), ('bins', bins)):
+        data = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+        np.save(os.path.join(path, name + '.npy'), data.astype(np.int64), allow_pickle=False)
+    with open(os.path.join(path, 'index.json.tmp'), mode='w') as f:
+        json.dump({'bin_shift': bin_shift, 'chroms': chroms}, f, indent=1)
+    os.replace(os.path.join(path, 'index.json.tmp'), os.path.join(path, 'index.json'))  # Written last
+    return IntervalIndex(path)
+
+
+# Function to tell whether a path is an interval index directory
+def is_interval_index(path):
+    return os.path.isfile(os.path.join(path, 'index.json'))
+
+
+# Read-only, memory-mapped view of an index written by build_interval_index
+# Opening an index only reads index.json; interval pages are loaded by the OS as queries touch them.
+# Pickling sends only the path, so process pools reopen the index instead of copying its arrays.
+class IntervalIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json'), mode='r') as f:
+            manifest = json.load(f)
+        self.bin_shift = manifest['bin_shift']
+        self.chroms = {entry['name']: entry for entry in manifest['chroms']}
+        self._arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r', allow_pickle=False)
+                        for name in ('starts', 'ends', 'covered', 'bins')}
+
+    def __reduce__(self):
+        return IntervalIndex, (self.path,)
+
+    def __contains__(self, chrom):
+        return chrom in self.chroms
+
+    def __iter__(self):
+        return iter(self.chroms)
+
+    # Merged (starts, ends) arrays of one chromosome
+    def intervals(self, chrom):
+        entry = self.chroms[chrom]
+        first, last = entry['interval_offset'], entry['interval_offset'] + entry['count']
+        return self._arrays['starts'][first:last], self._arrays['ends'][first:last]
+
+    # Merged (starts, ends) arrays of every chromosome, like merge_ranges returns
+    def items(self):
+        return ((chrom, self.intervals(chrom)) for chrom in self.chroms)
+
+    # Number of intervals starting at or before each position
+    # The bin table bounds each answer to the intervals starting in the position's bin, and a fixed number
+    # of vectorized bisection steps finishes the search inside that window.
+    def rank(self, chrom, positions):
+        entry = self.chroms[chrom]
+        starts, _ = self.intervals(chrom)
+        bins = self._arrays['bins'][entry['bin_offset']:entry['bin_offset'] + entry['bin_count']]
+        positions = np.asarray(positions, dtype=np.int64)
+        b = np.clip(positions >> self.bin_shift, 0, len(bins) - 1)
+        lo = bins[b]
+        hi = bins[np.minimum(b + 1, len(bins) - 1)]
+        for _ in range(int(entry['max_bin_width']).bit_length()):
+            searching = lo < hi
+            mid = (lo + hi) // 2
+            right = starts[np.minimum(mid, len(starts) - 1)] <= positions
+            lo = np.where(searching & right, mid + 1, lo)
+            hi = np.where(searching & ~right, mid, hi)
+        return lo
+
+    # Merged starts, ends and cumulative coverage of one chromosome, as memory-mapped views
+    def arrays(self, chrom):
+        entry = self.chroms[chrom]
+        starts, ends = self.intervals(chrom)
+        first = entry['covered_offset']
+        return starts, ends, self._arrays['covered'][first:first + entry['count'] + 1]
+
+    # Bases of the indexed set covered by each query interval of one chromosome, found through the bin table
+    def overlap(self, chrom, query_starts, query_ends):
+        starts, ends, covered = self.arrays(chrom)
+        before_end = covered_at(self.rank(chrom, query_ends) - 1, query_ends, starts, ends, covered)
+        before_start = covered_at(self.rank(chrom, query_starts) - 1, query_starts, starts, ends, covered)
+        return before_end - before_start
+
+
+# Function to count overlapping bases between a query set and an index, chromosome by chromosome
+def count_overlap_index(query, index):
+    total = 0
+    for chrom, (query_starts, query_ends) in query.items():
+        if chrom in index and len(query_starts):
+            total += int(index.overlap(chrom, query_starts, query_ends).sum())
+    return total
+
+
+if __name__ == '__main__':
+    # Build an index once for a fixed annotation: python interval_index.py SetB.bed[.gz] SetB.idx
+    if len(sys.argv) < 3:
+        print("Usage: python interval_index.py path/to/SetB.bed path/to/SetB.idx")
+        sys.exit(1)
+    index = build_interval_index(read_bed(sys.argv[1]), sys.argv[2])
+    print(f"Indexed {sum(entry['count'] for entry in index.chroms.values())} merged intervals "
+          f"on {len(index.chroms)} chromosomes in {sys.argv[2]}")
@@ -0,0 +1,127 @@
+import numpy as np
+from interval_arrays import as_interval_arrays, merge_intervals
+
+
+# Number of times a block's over-full segment deals are redrawn before giving up
+MAX_DEALS = 100
+
+
+# Random starts drawn uniformly below a per-interval exclusive bound (the tiers' original placement)
+class UniformStarts:
+    def __init__(self, bounds):
+        self.bounds = bounds
+
+    def __contains__(self, chrom):
+        return chrom in self.bounds
+
+    # (size x intervals) random starts for one chromosome
+    def draw(self, chrom, size, rng):
+        return rng.integers(0, self.bounds[chrom], size=(size, len(self.bounds[chrom])))
+
+
+# Function to list the allowed segments of one chromosome: [0, size) minus the merged excluded intervals
+def allowed_segments(size, excluded=None):
+    if excluded is None or len(excluded[0]) == 0:
+        return np.array([0], dtype=np.int64), np.array([size], dtype=np.int64)
+    starts, ends = excluded
+    starts, ends = np.clip(starts, 0, size), np.clip(ends, 0, size)
+    segment_starts = np.concatenate([[0], ends])
+    segment_ends = np.concatenate([starts, [size]])
+    keep = segment_ends > segment_starts
+    return segment_starts[keep].astype(np.int64), segment_ends[keep].astype(np.int64)
+
+
+# Shuffle of a query set into the allowed space of each chromosome, without rejection sampling
+# The allowed space is the chromosome minus the excluded intervals, kept as a list of segments.
+# With overlaps allowed, every interval's start is uniform over all positions where it fits entirely inside one
+# segment: a draw in [0, number of such positions) is mapped to its segment through cumulative tables built once
+# per distinct interval length. With no_overlap, each permutation deals every interval to a segment in proportion
+# to the number of positions where it fits there (segment length - interval length + 1, from the same tables), so a
+# segment barely longer than an interval is not over-sampled. Each segment's intervals are then placed by sorted gap
+# allocation: the intervals are put in random order and separated by sorted uniform gaps that add up to at most the
+# segment's free space, which spreads them uniformly over the segment without overlaps. Only a deal that overfills
+# a segment is redrawn.
+class AllowedSpaceShuffle:
+    def __init__(self, query, chrom_sizes, exclusions=None, no_overlap=False):
+        query = as_interval_arrays(query)
+        excluded = merge_intervals(as_interval_arrays(exclusions)) if exclusions is not None else {}
+        self.no_overlap = no_overlap
+        self.chroms = {}
+        for chrom, (starts, ends) in query.items():
+            size = chrom_sizes.get(chrom, 0)
+            if len(starts) == 0 or size == 0:
+                continue
+            segment_starts, segment_ends = allowed_segments(size, excluded.get(chrom))
+            lengths = ends - starts
+            entry = {'lengths': lengths, 'segment_starts': segment_starts,
+                     'segment_lengths': segment_ends - segment_starts}
+            entry.update(self._fit_tables(chrom, lengths, entry['segment_lengths']))
+            if no_overlap and lengths.sum() > entry['segment_lengths'].sum():
+                raise ValueError(f"{chrom}: ranges do not fit in the allowed space without overlapping")
+            self.chroms[chrom] = entry
+
+    # Per distinct length: how many starts fit in each segment, flattened and prefix-summed
+    def _fit_tables(self, chrom, lengths, segment_lengths):
+        unique_lengths, length_code = np.unique(lengths, return_inverse=True)
+        fits = np.maximum(segment_lengths[None, :] - unique_lengths[:, None] + 1, 0)
+        totals = fits.sum(axis=1)
+        if (totals == 0).any():
+            raise ValueError(f"{chrom}: a range of length {unique_lengths[totals == 0][0]} fits in no allowed segment")
+        return {'fits': fits.ravel(), 'cumulative': np.cumsum(fits.ravel()), 'totals': totals[length_code],
+                'base': (np.cumsum(totals) - totals)[length_code], 'row': length_code * len(segment_lengths)}
+
+    def __contains__(self, chrom):
+        return chrom in self.chroms
+
+    # (size x intervals) random starts for one chromosome, in the query's interval order
+    def draw(self, chrom, size, rng):
+        entry = self.chroms[chrom]
+        if self.no_overlap:
+            return self._draw_without_overlap(entry, size, rng)
+        position, flat = self._fit_positions(entry, size, rng)
+        offset = position - (entry['cumulative'][flat] - entry['fits'][flat])
+        return entry['segment_starts'][flat - entry['row']] + offset
+
+    # (size x intervals) fit positions drawn uniformly per interval, with their flat (length, segment) table cells
+    def _fit_positions(self, entry, size, rng):
+        position = rng.integers(0, entry['totals'], size=(size, len(entry['lengths']))) + entry['base']
+        return position, np.searchsorted(entry['cumulative'], position, side='right')
+
+    # (size x intervals) segments, each interval's drawn in proportion to its number of fit positions in the segment
+    def _deal(self, entry, size, rng):
+        return self._fit_positions(entry, size, rng)[1] - entry['row']
+
+    def _draw_without_overlap(self, entry, size, rng):
+        lengths, segment_lengths = entry['lengths'], entry['segment_lengths']
+        n, n_segments = len(lengths), len(segment_lengths)
+        rows = np.arange(size)[:, None]
+
+        # Deal intervals to segments by fit positions; redraw only the rows that overfill a segment
+        segment = self._deal(entry, size, rng)
+        for _ in range(MAX_DEALS):
+            load = np.zeros((size, n_segments), dtype=np.int64)
+            np.add.at(load, (np.broadcast_to(rows, segment.shape), segment), lengths)
+            full = (load > segment_lengths).any(axis=1)
+            if not full.any():
+                break
+            segment[full] = self._deal(entry, int(full.sum()), rng)
+        else:
+            raise ValueError("Could not deal the ranges to allowed segments without overfilling one")
+
+        # Random order of the intervals inside each segment, and one sorted gap per interval
+        free = segment_lengths[segment] - load[rows, segment]
+        order = np.argsort(segment * 2 ** 32 + rng.integers(0, 2 ** 32, size=(size, n)), axis=1)
+        ordered_segment = np.take_along_axis(segment, order, axis=1)
+        scale = np.int64(free.max() + 1)
+        gaps = np.sort(segment * scale + rng.integers(0, free + 1), axis=1) - ordered_segment * scale
+
+        # Start = segment start + gap + lengths of the intervals placed before it in the same segment
+        ordered_lengths = lengths[order]
+        before = np.cumsum(ordered_lengths, axis=1) - ordered_lengths
+        group_start = np.ones((size, n), dtype=bool)
+        group_start[:, 1:] = ordered_segment[:, 1:] != ordered_segment[:, :-1]
+        before -= np.maximum.accumulate(np.where(group_start, before, 0), axis=1)
+
+        starts = np.empty((size, n), dtype=np.int64)
+        np.put_along_axis(starts, order, entry['segment_starts'][ordered_segment] + gaps + before, axis=1)
+        return starts
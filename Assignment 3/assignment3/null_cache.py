@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import numpy as np
+from interval_shuffle import UniformStarts, AllowedSpaceShuffle
+
+
+# Default size limit of a cache directory, in bytes
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+
+
+# Function to add int64 array contents to a digest
+def update_array(digest, array):
+    digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+
+
+# Function to compute the cache key of a null distribution
+# The null depends on the merged target, the chromosome sizes, each chromosome's multiset of query lengths (with
+# the start bound of each length for the tiers' own placement, or the allowed segments of a shuffle), the number of
+# permutations and the seed; interval positions and order do not enter, so equivalent queries share one entry.
+def null_key(query, target, chrom_sizes, placement, num_permutations, seed):
+    digest = hashlib.sha256()
+    for chrom, (starts, ends) in sorted(target.items()):
+        digest.update(chrom.encode() + b'\0')
+        update_array(digest, starts)
+        update_array(digest, ends)
+    digest.update(json.dumps(sorted(chrom_sizes.items())).encode())
+
+    bounds = placement.bounds if isinstance(placement, UniformStarts) else placement
+    for chrom, (starts, ends) in sorted(query.items()):
+        lengths = ends - starts
+        digest.update(b'query:' + chrom.encode() + b'\0')
+        if isinstance(bounds, dict):
+            chrom_bounds = bounds.get(chrom, np.zeros(0, dtype=np.int64))
+            if len(chrom_bounds) == 0:
+                continue
+            order = np.lexsort((chrom_bounds, lengths))
+            update_array(digest, lengths[order])
+            update_array(digest, chrom_bounds[order])
+        else:
+            update_array(digest, np.sort(lengths))
+
+    if isinstance(placement, AllowedSpaceShuffle):
+        digest.update(b'allowed-space' + (b':no-overlap' if placement.no_overlap else b''))
+        for chrom, entry in sorted(placement.chroms.items()):
+            digest.update(chrom.encode() + b'\0')
+            update_array(digest, entry['segment_starts'])
+            update_array(digest, entry['segment_lengths'])
+    digest.update(json.dumps([num_permutations, seed]).encode())
+    return digest.hexdigest()
+
+
+# On-disk library of null overlap distributions, one .npy per key, bounded in total size
+# Reads refresh a file's modification time, and writes evict the least recently used files once the directory
+# grows past max_bytes, so repeated screens keep their working set and the cache never grows without limit.
+class NullDistributionCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"null_{key}.npy")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # Mark as recently used
+        return np.load(path, allow_pickle=False)
+
+    def put(self, key, null):
+        path = self._path(key)
+        with open(path + '.tmp', mode='wb') as f:
+            np.save(f, null, allow_pickle=False)
+        os.replace(path + '.tmp', path)  # Never leave a half-written entry behind
+        self.evict(keep=path)
+
+    # Remove least recently used entries until the directory fits in max_bytes
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('null_') and name.endswith('.npy'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(self.directory, name)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
@@ -0,0 +1,100 @@
+import argparse
+import csv
+import os
+import numpy as np
+from bed_reader import read_bed, read_fai
+from interval_arrays import merge_intervals, count_overlap
+from interval_index import IntervalIndex, is_interval_index, count_overlap_index
+from interval_shuffle import AllowedSpaceShuffle
+from permutation_null import parallel_permuted_overlaps, prepare_target, start_pool
+
+
+# Function to load and merge one track, or open it if it is an interval index
+def load_track(path):
+    return IntervalIndex(path) if is_interval_index(path) else merge_intervals(read_bed(path))
+
+
+# Function to turn a track into a query set (an index is read back into merged arrays)
+def as_query(track):
+    return dict(track.items()) if isinstance(track, IntervalIndex) else track
+
+
+# Function to count overlapping bases between a merged query and a merged target or index
+def observed_overlap(query, target):
+    if isinstance(target, IntervalIndex):
+        return count_overlap_index(query, target)
+    return count_overlap(query, target)
+
+
+# Function to compute observed overlaps and permutation p-values for every query x target pair
+# Every distinct path is loaded and merged once. For each query, each block of shuffles is drawn once and scored
+# against all targets (see score_permutations), so adding a target adds no shuffling work. Query i uses the seed
+# sequence (seed, i), so rows are independent and reproducible for any number of workers. With workers > 1 a single
+# process pool, holding the prepared targets and every query's placement, serves all rows.
+# Returns (observed, p_values) as (queries x targets) arrays.
+def enrichment_matrix(query_paths, target_paths, chrom_sizes, num_permutations=10000, seed=None, workers=1,
+                      exclusions=None, no_overlap=False, verbose=False):
+    tracks = {path: load_track(path) for path in dict.fromkeys(query_paths + target_paths)}
+    targets = [tracks[path] for path in target_paths]
+    queries = [as_query(tracks[path]) for path in query_paths]
+    placements = [AllowedSpaceShuffle(query, chrom_sizes, exclusions, no_overlap) for query in queries]
+    pool = start_pool(workers, list(zip(queries, placements)), prepare_target(targets)) if workers > 1 else None
+
+    observed = np.zeros((len(query_paths), len(target_paths)), dtype=np.int64)
+    p_values = np.zeros((len(query_paths), len(target_paths)))
+    try:
+        for i, path in enumerate(query_paths):
+            observed[i] = [observed_overlap(queries[i], target) for target in targets]
+            query_seed = None if seed is None else [seed, i]
+            null = parallel_permuted_overlaps(queries[i], targets, placements[i], num_permutations, query_seed,
+                                              workers, pool=pool, job=i)
+            p_values[i] = ((null >= observed[i][:, None]).sum(axis=1) + 1) / (num_permutations + 1)
+            if verbose:
+                print(f"{path}: {len(target_paths)} targets done")  # Debugging statement
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return observed, p_values
+
+
+# Function to write a (queries x targets) matrix as TSV with track names as row and column labels
+def write_matrix(path, matrix, query_paths, target_paths):
+    with open(path, mode='w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['#query'] + [os.path.basename(target) for target in target_paths])
+        for query, row in zip(query_paths, matrix.tolist()):
+            writer.writerow([os.path.basename(query)] + row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Overlap enrichment matrix for many BED tracks.")
+    parser.add_argument('fai_file', help="path/to/genome.fa.fai")
+    # All pairs of --tracks, or every --queries file against every --targets file (one-vs-many)
+    parser.add_argument('--tracks', nargs='+', default=None)
+    parser.add_argument('--queries', nargs='+', default=None)
+    parser.add_argument('--targets', nargs='+', default=None)
+    parser.add_argument('--permutations', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--exclude', default=None, help="BED file of regions ranges may not be placed in")
+    parser.add_argument('--no-overlap', action='store_true')
+    parser.add_argument('--output', default='enrichment_pvalues.tsv', help="p-value matrix TSV")
+    parser.add_argument('--observed', default='enrichment_observed.tsv', help="Observed overlap matrix TSV")
+    args = parser.parse_args(argv)
+
+    if args.tracks:
+        query_paths = target_paths = args.tracks
+    elif args.queries and args.targets:
+        query_paths, target_paths = args.queries, args.targets
+    else:
+        parser.error("Give --tracks for all pairs, or --queries and --targets")
+
+    exclusions = read_bed(args.exclude) if args.exclude else None
+    observed, p_values = enrichment_matrix(query_paths, target_paths, read_fai(args.fai_file), args.permutations,
+                                           args.seed, args.workers, exclusions, args.no_overlap, verbose=True)
+    write_matrix(args.output, p_values, query_paths, target_paths)
+    write_matrix(args.observed, observed, query_paths, target_paths)
+
+
+if __name__ == '__main__':
+    main()
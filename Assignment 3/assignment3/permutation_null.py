@@ -0,0 +1,227 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+from coverage_bitmap import CoverageBitmap, use_bitmap
+from interval_arrays import merge_sorted_intervals, cumulative_coverage, overlap_per_interval
+from interval_index import IntervalIndex
+from interval_shuffle import UniformStarts
+from null_cache import null_key
+
+
+# Default memory budget for one block of permutations, in bytes (small blocks stay cache-friendly)
+DEFAULT_MEMORY_BUDGET = 16 * 2 ** 20
+
+# Permutations per independently seeded chunk; fixed so the null does not depend on the worker count
+CHUNK_PERMUTATIONS = 1000
+
+# Number of (permutations x intervals) int64 temporaries alive while a block is scored
+BLOCK_TEMPORARIES = 8
+
+
+# Function to pick how many permutations fit in one block: each needs BLOCK_TEMPORARIES int64 values per interval
+def block_size(n_intervals, memory_budget=DEFAULT_MEMORY_BUDGET):
+    per_permutation = max(n_intervals, 1) * 8 * BLOCK_TEMPORARIES
+    return max(1, int(memory_budget // per_permutation))
+
+
+# Function to prepare the target side once, per chromosome: a packed coverage bitmap when the chromosome is compact
+# and dense enough (backend 'auto', see coverage_bitmap.use_bitmap), otherwise merged starts, ends and cumulative
+# coverage. An IntervalIndex is already merged and prefix-summed on disk, so it is queried as is; a list of targets
+# is prepared target by target.
+def prepare_target(target, backend='auto'):
+    if isinstance(target, list):
+        return [prepare_target(each, backend) for each in target]
+    if isinstance(target, IntervalIndex):
+        return target
+    prepared = {}
+    for chrom, (starts, ends) in target.items():
+        starts, ends = merge_sorted_intervals(starts, ends)
+        if len(starts) == 0:
+            continue
+        if backend == 'bitmap' or (backend == 'auto' and use_bitmap(starts, ends)):
+            prepared[chrom] = CoverageBitmap(starts, ends)
+        else:
+            prepared[chrom] = (starts, ends, cumulative_coverage(starts, ends))
+    return prepared
+
+
+# Function to build the null distribution of overlaps for many random placements of `query`
+# `placement` maps each chromosome to the exclusive upper bound of every query interval's random start, or is a
+# shuffle from interval_shuffle.py (chromosomes it does not cover are not placed). Each block draws a (permutations x intervals) start array per
+# chromosome and scores every row against the merged target at once; query order does not change the overlap,
+# so the rows are never sorted. Returns an int64 array of `num_permutations` overlaps.
+def permuted_overlaps(query, target, placement, num_permutations, rng=None,
+                      memory_budget=DEFAULT_MEMORY_BUDGET):
+    rng = np.random.default_rng() if rng is None else rng
+    return score_permutations(query, prepare_target(target), placement, num_permutations, rng, memory_budget)
+
+
+# Function to score `num_permutations` random placements of `query` against a prepared target
+# With a list of prepared targets, every shuffle is drawn once and scored against all of them, and the result is a
+# (targets x permutations) array.
+def score_permutations(query, prepared, placement, num_permutations, rng, memory_budget=DEFAULT_MEMORY_BUDGET):
+    if isinstance(placement, dict):
+        placement = UniformStarts(placement)
+    targets = prepared if isinstance(prepared, list) else [prepared]
+    chroms = [chrom for chrom in query if chrom in placement and len(query[chrom][0])
+              and any(chrom in target for target in targets)]
+    lengths = {chrom: query[chrom][1] - query[chrom][0] for chrom in chroms}
+    step = block_size(max((len(lengths[chrom]) for chrom in chroms), default=0), memory_budget)
+
+    overlaps = np.zeros((len(targets), num_permutations), dtype=np.int64)
+    for first in range(0, num_permutations, step):
+        size = min(step, num_permutations - first)
+        for chrom in chroms:
+            new_starts = placement.draw(chrom, size, rng)
+            for row, target in enumerate(targets):
+                if chrom in target:
+                    overlap = target_overlap(target, chrom, new_starts, new_starts + lengths[chrom])
+                    overlaps[row, first:first + size] += overlap.sum(axis=1)
+    return overlaps if isinstance(prepared, list) else overlaps[0]
+
+
+# Function to count the bases of a prepared target covered by each query interval of one chromosome
+def target_overlap(prepared, chrom, query_starts, query_ends):
+    # Blocks of permutations touch every page of the chromosome anyway, so a plain binary search over the
+    # mapped arrays beats the bin table here
+    if isinstance(prepared, IntervalIndex):
+        starts, ends, covered = prepared.arrays(chrom)
+    elif isinstance(prepared[chrom], CoverageBitmap):
+        return prepared[chrom].overlap(query_starts, query_ends)
+    else:
+        starts, ends, covered = prepared[chrom]
+    return overlap_per_interval(query_starts, query_ends, starts, ends, covered)
+
+
+# (query, placement) jobs, prepared target and memory budget of a worker process, set once by the pool initializer
+_worker_state = {}
+
+
+# Function to receive the shared inputs once per worker instead of once per task
+def init_worker(jobs, prepared, memory_budget):
+    _worker_state.update(jobs=jobs, prepared=prepared, memory_budget=memory_budget)
+
+
+# Function to start a process pool whose workers hold the prepared target and every (query, placement) job
+# A caller with many queries against the same target (overlap_matrix.py) starts one pool and passes it, with the
+# job number of each query, to iter_null_chunks or parallel_permuted_overlaps.
+def start_pool(workers, jobs, prepared, memory_budget=DEFAULT_MEMORY_BUDGET):
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(jobs, prepared, memory_budget))
+
+
+# Function to score one seeded chunk of permutations of one job inside a worker
+def score_chunk(task):
+    job, seed, size = task
+    state = _worker_state
+    query, placement = state['jobs'][job]
+    return score_permutations(query, state['prepared'], placement, size, np.random.default_rng(seed),
+                              state['memory_budget'])
+
+
+# Function to split permutations into fixed-size chunks, each with its own child of SeedSequence(seed)
+def seeded_chunks(num_permutations, seed=None):
+    sizes = [min(CHUNK_PERMUTATIONS, num_permutations - first)
+             for first in range(0, num_permutations, CHUNK_PERMUTATIONS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return list(zip(seeds, sizes))
+
+
+# Function to yield the null overlaps chunk by chunk, in chunk order, optionally scored on a process pool
+# Chunks and their seeds depend only on `seed` and `num_permutations`, so the sequence is identical for any number
+# of workers. The target is merged once and handed to each worker by the pool initializer; chunks are submitted
+# one wave (one chunk per worker) at a time so a consumer that stops early leaves little work behind. With `pool`
+# (see start_pool) the chunks of job `job` run on that pool, which already holds the target, query and placement.
+def iter_null_chunks(query, target, placement, num_permutations, seed=None, workers=1,
+                     memory_budget=DEFAULT_MEMORY_BUDGET, pool=None, job=0):
+    tasks = [(job, chunk_seed, size) for chunk_seed, size in seeded_chunks(num_permutations, seed)]
+    if pool is not None:
+        for first in range(0, len(tasks), workers):
+            yield from pool.map(score_chunk, tasks[first:first + workers])
+        return
+    prepared = prepare_target(target)
+    if workers <= 1 or len(tasks) <= 1:
+        for _, chunk_seed, size in tasks:
+            yield score_permutations(query, prepared, placement, size, np.random.default_rng(chunk_seed),
+                                     memory_budget)
+        return
+    with start_pool(workers, [(query, placement)], prepared, memory_budget) as pool:
+        for first in range(0, len(tasks), workers):
+            yield from pool.map(score_chunk, tasks[first:first + workers])
+
+
+# Function to build the whole null distribution reproducibly, optionally on a process pool
+# (one row per target when `target` is a list; `pool` and `job` as in iter_null_chunks)
+def parallel_permuted_overlaps(query, target, placement, num_permutations, seed=None, workers=1,
+                               memory_budget=DEFAULT_MEMORY_BUDGET, pool=None, job=0):
+    chunks = list(iter_null_chunks(query, target, placement, num_permutations, seed, workers, memory_budget,
+                                   pool, job))
+    if not chunks:
+        return np.zeros((len(target), 0) if isinstance(target, list) else 0, dtype=np.int64)
+    return np.concatenate(chunks, axis=-1)
+
+
+# Function to count null overlaps >= observed, with optional Besag-Clifford sequential stopping
+# Without `early_stop` all `num_permutations` are used. With it, sampling stops at the permutation where the
+# `early_stop`-th exceedance is seen, so clearly null tests end after a few hundred draws while extreme ones run up
+# to the cap. The stopping point depends only on the seed, not on the number of workers.
+# Returns (exceedances, permutations used).
+def sequential_exceedances(query, target, placement, observed, num_permutations, early_stop=None, seed=None,
+                           workers=1, memory_budget=DEFAULT_MEMORY_BUDGET):
+    exceed = used = 0
+    chunks = iter_null_chunks(query, target, placement, num_permutations, seed, workers, memory_budget)
+    for overlaps in chunks:
+        hits = overlaps >= observed
+        if early_stop is not None and exceed + int(hits.sum()) >= early_stop:
+            stop_at = int(np.argmax(exceed + np.cumsum(hits) >= early_stop)) + 1
+            chunks.close()  # Shuts the pool down after the current wave
+            return early_stop, used + stop_at
+        exceed += int(hits.sum())
+        used += len(overlaps)
+    return exceed, used
+
+
+# Function to count exceedances in an already computed null, with the same stopping rule as sequential_exceedances
+def null_exceedances(null, observed, early_stop=None):
+    hits = null >= observed
+    if early_stop is not None and int(hits.sum()) >= early_stop:
+        return early_stop, int(np.argmax(np.cumsum(hits) >= early_stop)) + 1
+    return int(hits.sum()), len(null)
+
+
+# Function to count exceedances, answering from a NullDistributionCache (null_cache.py) when it holds a matching null
+# Only seeded runs are cached. On a miss the full null is computed and stored; with early_stop a miss runs the
+# sequential test instead and stores nothing, since an early-stopped null is incomplete.
+def cached_exceedances(query, target, chrom_sizes, placement, observed, num_permutations, early_stop=None,
+                       seed=None, workers=1, null_cache=None):
+    if null_cache is None or seed is None:
+        return sequential_exceedances(query, target, placement, observed, num_permutations, early_stop, seed, workers)
+    key = null_key(query, target, chrom_sizes, placement, num_permutations, seed)
+    null = null_cache.get(key)
+    if null is None:
+        if early_stop is not None:
+            return sequential_exceedances(query, target, placement, observed, num_permutations, early_stop, seed,
+                                          workers)
+        null = parallel_permuted_overlaps(query, target, placement, num_permutations, seed, workers)
+        null_cache.put(key, null)
+    return null_exceedances(null, observed, early_stop)
+
+
+# Function to turn exceedances into a p-value, like the Assignment 2 permutation test:
+# early_stop / permutations used when stopped early, otherwise (exceedances + 1) / (permutations + 1)
+def permutation_p_value(exceed, used, early_stop=None):
+    if early_stop is not None and exceed >= early_stop:
+        return exceed / used
+    return (exceed + 1) / (used + 1)
+
+
+# Function to give a Wilson score confidence interval for p from `exceed` hits in `used` permutations
+# (a binomial approximation; it ignores the small bias of the stopping rule)
+def p_value_interval(exceed, used, confidence=0.95):
+    if used == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = exceed / used
+    center = (p + z * z / (2 * used)) / (1 + z * z / used)
+    half = z * math.sqrt(p * (1 - p) / used + z * z / (4 * used * used)) / (1 + z * z / used)
+    return max(0.0, center - half), min(1.0, center + half)
@@ -0,0 +1,36 @@
+import numpy as np
+from interval_shuffle import AllowedSpaceShuffle
+
+
+# A 60 bp range shuffled without overlaps into a 1000 bp chromosome with [100, 200) excluded: every start that keeps
+# it inside [0, 100) or [200, 1000) is equally likely, so the 100 bp segment holds 41 of the 782 placements
+def test_no_overlap_placements_are_uniform_over_fit_positions():
+    shuffle = AllowedSpaceShuffle({'chr1': (np.array([0]), np.array([60]))}, {'chr1': 1000},
+                                  {'chr1': (np.array([100]), np.array([200]))}, no_overlap=True)
+    draws = 200000
+    starts = shuffle.draw('chr1', draws, np.random.default_rng(0)).ravel()
+    histogram = np.bincount(starts, minlength=1000)
+
+    allowed = np.zeros(1000, dtype=bool)
+    allowed[0:41] = allowed[200:941] = True
+    assert histogram[~allowed].sum() == 0
+
+    expected = draws / allowed.sum()
+    assert np.all(np.abs(histogram[allowed] - expected) < 5 * np.sqrt(expected))
+    share = histogram[:41].sum() / draws
+    assert abs(share - 41 / 782) < 5 * np.sqrt(41 / 782 * (1 - 41 / 782) / draws)
+
+
+# Shuffled ranges stay inside the allowed segments and never overlap each other
+def test_no_overlap_placements_are_disjoint_and_allowed():
+    starts, ends = np.array([0, 100, 300, 500]), np.array([60, 130, 350, 520])
+    shuffle = AllowedSpaceShuffle({'chr1': (starts, ends)}, {'chr1': 1000},
+                                  {'chr1': (np.array([100]), np.array([200]))}, no_overlap=True)
+    placed = shuffle.draw('chr1', 1000, np.random.default_rng(1))
+    lengths = ends - starts
+    for row in placed:
+        order = np.argsort(row)
+        row_starts, row_ends = row[order], row[order] + lengths[order]
+        assert np.all(row_starts[1:] >= row_ends[:-1])
+        assert np.all((row_ends <= 100) | (row_starts >= 200))
+        assert row_ends.max() <= 1000
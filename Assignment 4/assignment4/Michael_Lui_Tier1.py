@@ -1,27 +1,27 @@
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.cluster import KMeans
 from sklearn.metrics import confusion_matrix
 import pandas as pd
+from streaming_kmeans import streaming_kmeans, DEFAULT_BATCH_SIZE
+from kmeans_sweep import clustering_errors
 
-# Load MNIST data
-MNIST_X = np.load('MNIST_X_subset.npy', allow_pickle=True)
-MNIST_y = np.load('MNIST_y_subset.npy', allow_pickle=True)
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="K-Means clustering of MNIST with clustering error.")
+    parser.add_argument('--data', default='MNIST_X_subset.npy')
+    parser.add_argument('--labels', default='MNIST_y_subset.npy')
+    # Mini-batch k-means over a memory-mapped .npy in float32 batches, for inputs that do not fit in RAM
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--restarts', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=1)
+    return parser.parse_args(argv)
 
-# Reshape and visualize the first example
-first_example = MNIST_X[0].reshape(28, 28)
-plt.imshow(first_example, cmap='gray')
-plt.title("First MNIST Example")
-plt.axis('off')
-plt.show()
-
-# Perform K-Means clustering on MNIST dataset
-def perform_kmeans(X, y, K):
-    kmeans = KMeans(n_clusters=K, random_state=42)
-    y_pred = kmeans.fit_predict(X)
-
-    # Reshape and visualize centroids
-    centroids = kmeans.cluster_centers_.reshape(K, 28, 28)
+# Reshape and visualize centroids
+def plot_centroids(centers, K):
+    centroids = centers.reshape(K, 28, 28)
     rows = K // 2 + K % 2  # Calculate the number of rows needed
     plt.figure(figsize=(10, 5))
     for i in range(K):
@@ -32,24 +32,48 @@ def perform_kmeans(X, y, K):
     plt.savefig(f'centroids_k{K}.png')
     plt.show()
 
-    # Compute clustering error
-    clustering_error = 0
-    for cluster in range(K):
-        cluster_labels = y[y_pred == cluster]
-        if len(cluster_labels) > 0:
-            majority_label = np.bincount(cluster_labels).argmax()
-            error_count = len(cluster_labels) - np.sum(cluster_labels == majority_label)
-            clustering_error += error_count
-    
-    return clustering_error
-
-# Perform K-Means for K=10 and K=11 and report errors
-for K in [10, 11]:
-    error = perform_kmeans(MNIST_X, MNIST_y, K)
-    print(f'K={K} Error={error}')
-
-# Load Dogs SNP Dataset (Tier 3)
-dogs_X = np.load('dogs_X.npy', allow_pickle=True)
-dogs_clades = np.load('dogs_clades.npy', allow_pickle=True)
-
-# Optional: You can apply a similar K-Means clustering process for the Dogs SNP dataset.
+# Compute clustering error from the cluster-by-label contingency table (see kmeans_sweep.py)
+def compute_clustering_error(y, y_pred, K):
+    return clustering_errors(y, [y_pred], [K])[0]
+
+# Perform K-Means clustering on MNIST dataset
+def perform_kmeans(X, y, K):
+    kmeans = KMeans(n_clusters=K, random_state=42)
+    y_pred = kmeans.fit_predict(X)
+    plot_centroids(kmeans.cluster_centers_, K)
+    return compute_clustering_error(y, y_pred, K)
+
+# Perform mini-batch K-Means on a memory-mapped .npy file (see streaming_kmeans.py)
+def perform_kmeans_streaming(path, y, K, restarts=4, workers=1, batch_size=DEFAULT_BATCH_SIZE, epochs=3):
+    model, y_pred, _ = streaming_kmeans(path, K, restarts, workers, batch_size, epochs)
+    plot_centroids(model.cluster_centers_, K)
+    return compute_clustering_error(y, y_pred, K)
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    # Load MNIST data (memory-mapped in streaming mode, so only the rows in use are read)
+    MNIST_X = np.load(args.data, mmap_mode='r') if args.stream else np.load(args.data, allow_pickle=True)
+    MNIST_y = np.load(args.labels, allow_pickle=True)
+
+    # Reshape and visualize the first example
+    first_example = np.asarray(MNIST_X[0]).reshape(28, 28)
+    plt.imshow(first_example, cmap='gray')
+    plt.title("First MNIST Example")
+    plt.axis('off')
+    plt.show()
+
+    # Perform K-Means for K=10 and K=11 and report errors
+    for K in [10, 11]:
+        if args.stream:
+            error = perform_kmeans_streaming(args.data, MNIST_y, K, args.restarts, args.workers, args.batch_size,
+                                             args.epochs)
+        else:
+            error = perform_kmeans(MNIST_X, MNIST_y, K)
+        print(f'K={K} Error={error}')
+
+    # Load Dogs SNP Dataset (Tier 3)
+    dogs_X = np.load('dogs_X.npy', allow_pickle=True)
+    dogs_clades = np.load('dogs_clades.npy', allow_pickle=True)
+
+    # Optional: You can apply a similar K-Means clustering process for the Dogs SNP dataset.
@@ -3,13 +3,31 @@ import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import dendrogram, linkage, fcluster
 from sklearn.metrics import confusion_matrix
 from collections import Counter
+import argparse
+from memory_linkage import memory_bounded_linkage, DEFAULT_MEMORY_BUDGET
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Hierarchical clustering of MNIST.")
+    # 'tiled' keeps memory under --memory-budget (exact while all points fit, grouped approximation beyond that)
+    parser.add_argument('--linkage', choices=['scipy', 'tiled'], default='scipy')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // 2 ** 20, help="MiB")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+# Average-linkage Z from SciPy, or from memory_linkage.py with float32 distance tiles
+def average_linkage(X, args):
+    if args.linkage == 'tiled':
+        return memory_bounded_linkage(X, args.memory_budget * 2 ** 20, args.seed)
+    return linkage(X, method='average')
+
+args = parse_arguments()
 
 # Load MNIST data
 MNIST_X = np.load('MNIST_X_subset.npy', allow_pickle=True)
 MNIST_y = np.load('MNIST_y_subset.npy', allow_pickle=True)
 
 # Perform hierarchical clustering with average linkage
-Z = linkage(MNIST_X, method='average')
+Z = average_linkage(MNIST_X, args)
 
 # Assign cluster labels for K=10
 cluster_labels = fcluster(Z, t=10, criterion='maxclust')
@@ -2,13 +2,45 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import dendrogram, linkage, fcluster
 from collections import Counter
+import argparse
+from memory_linkage import memory_bounded_linkage, DEFAULT_MEMORY_BUDGET
+from functools import partial
+from packed_genotypes import read_packed, condensed_genotype_distances, genotype_distances
 
-# Load Dogs SNP data and clade information
-dogs_X = np.load('dogs_X.npy', allow_pickle=True)
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Hierarchical clustering of the Dogs SNP data.")
+    # 'tiled' keeps memory under --memory-budget (exact while all points fit, grouped approximation beyond that)
+    parser.add_argument('--linkage', choices=['scipy', 'tiled'], default='scipy')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // 2 ** 20, help="MiB")
+    parser.add_argument('--seed', type=int, default=0)
+    # 2-bit packed genotypes written by packed_genotypes.py; distances come from popcounts of the packed words
+    # (dogs_X.npy is not loaded; with --linkage tiled the kernel feeds the memory-bounded linkage)
+    parser.add_argument('--packed', default=None, help="path/to/dogs_X.packed.npy")
+    parser.add_argument('--metric', choices=['euclidean', 'ibs'], default='euclidean')
+    return parser.parse_args(argv)
+
+# Average-linkage Z from SciPy, or from memory_linkage.py with float32 distance tiles
+def average_linkage(X, args):
+    if args.linkage == 'tiled':
+        return memory_bounded_linkage(X, args.memory_budget * 2 ** 20, args.seed)
+    return linkage(X, method='average')
+
+args = parse_arguments()
+
+# Load clade information
 dogs_clades = np.load('dogs_clades.npy', allow_pickle=True)
 
 # Perform hierarchical clustering on the Dogs dataset
-Z = linkage(dogs_X, method='average')
+if args.packed:
+    words, n_snps = read_packed(args.packed)
+    if args.linkage == 'tiled':
+        Z = memory_bounded_linkage(words, args.memory_budget * 2 ** 20, args.seed,
+                                   partial(genotype_distances, metric=args.metric, dtype=np.float32))
+    else:
+        Z = linkage(condensed_genotype_distances(words, args.metric), method='average')
+else:
+    dogs_X = np.load('dogs_X.npy', allow_pickle=True)
+    Z = average_linkage(dogs_X, args)
 
 # Assign cluster labels for K=30
 cluster_labels = fcluster(Z, t=30, criterion='maxclust')
@@ -0,0 +1,164 @@
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.cluster import KMeans
+
+
+# Feature matrix of a worker process, set once by the pool initializer
+_worker_state = {}
+
+
+# Function to parse a K range such as "10", "2-20" or "5,10,15" into a sorted list of distinct K
+def parse_k_range(text):
+    Ks = set()
+    for part in text.split(','):
+        if '-' in part:
+            low, high = part.split('-')
+            Ks.update(range(int(low), int(high) + 1))
+        else:
+            Ks.add(int(part))
+    return sorted(Ks)
+
+
+# Function to build the label-by-cluster contingency table of every K in one pass
+# Cluster ids of K are shifted by the sum of the smaller K, so a single bincount over (shifted cluster, label) pairs
+# counts all sweeps at once. Returns (classes, tables) with one (K, number of classes) table per K.
+def contingency_tables(y, labels_by_K, Ks):
+    classes, y_codes = np.unique(y, return_inverse=True)
+    offsets = np.concatenate([[0], np.cumsum(Ks)])
+    shifted = np.asarray(labels_by_K, dtype=np.int64) + offsets[:-1, None]
+    counts = np.bincount((shifted * len(classes) + y_codes).ravel(), minlength=offsets[-1] * len(classes))
+    counts = counts.reshape(offsets[-1], len(classes))
+    return classes, [counts[offsets[i]:offsets[i + 1]] for i in range(len(Ks))]
+
+
+# Function to compute the clustering error of every K: points not carrying their cluster's majority label
+def clustering_errors(y, labels_by_K, Ks):
+    _, tables = contingency_tables(y, labels_by_K, Ks)
+    return [int(table.sum() - table.max(axis=1).sum()) for table in tables]
+
+
+# Function to add new centroids to a fitted set, each drawn k-means++ style (with probability proportional to the
+# squared distance to the nearest current centroid)
+# Used to warm-start K + 1 from the solution for K: the old centroids stay where they are and the new one lands in a
+# poorly served region, so the next fit usually needs only a few Lloyd iterations.
+def grow_centers(X, centers, K, rng):
+    centers = np.asarray(centers, dtype=np.float64)
+    distances = nearest_distances(X, centers)
+    while len(centers) < K:
+        new_center = np.asarray(X[rng.choice(len(X), p=distances / distances.sum())], dtype=np.float64)
+        centers = np.vstack([centers, new_center])
+        distances = np.minimum(distances, nearest_distances(X, new_center[None]))
+    return centers
+
+
+# Function to compute the squared distance from every point to its nearest centroid, in blocks of rows
+def nearest_distances(X, centers, block_rows=4096):
+    center_norms = (centers ** 2).sum(axis=1)
+    distances = np.empty(len(X))
+    for first in range(0, len(X), block_rows):
+        block = np.asarray(X[first:first + block_rows], dtype=np.float64)
+        squared = (block ** 2).sum(axis=1)[:, None] - 2 * block @ centers.T + center_norms
+        distances[first:first + block_rows] = np.maximum(squared.min(axis=1), 0)
+    return distances
+
+
+# Function to fit k-means for one K; returns (K, labels, inertia, centroids, iterations)
+def fit_kmeans(X, K, seed=42, init=None):
+    if init is None:
+        kmeans = KMeans(n_clusters=K, random_state=seed)  # Same settings as perform_kmeans in Tier 1
+    else:
+        kmeans = KMeans(n_clusters=K, init=init, n_init=1, random_state=seed)
+    labels = kmeans.fit_predict(X)
+    return K, labels.astype(np.int32), float(kmeans.inertia_), kmeans.cluster_centers_, int(kmeans.n_iter_)
+
+
+# Function to store the feature matrix in a worker process
+def init_worker(X):
+    _worker_state.update(X=X)
+
+
+# Function to fit one K inside a worker
+def fit_task(task):
+    K, seed = task
+    return fit_kmeans(_worker_state['X'], K, seed)
+
+
+# Function to fit k-means over a range of K
+# Cold fits are independent and can run in a process pool (the data is handed over once by the initializer); warm
+# starts run in increasing K, each seeded with the previous centroids plus new ones drawn k-means++ style, with
+# probability proportional to the squared distance to the nearest centroid (grow_centers).
+# Returns the fits in increasing K.
+def sweep_fits(X, Ks, seed=42, workers=1, warm_start=False):
+    if warm_start:
+        rng = np.random.default_rng(seed)
+        fits = [fit_kmeans(X, Ks[0], seed)]
+        for K in Ks[1:]:
+            fits.append(fit_kmeans(X, K, seed, init=grow_centers(X, fits[-1][3], K, rng)))
+        return fits
+    if workers > 1 and len(Ks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(X,)) as pool:
+            return list(pool.map(fit_task, [(K, seed) for K in Ks]))
+    return [fit_kmeans(X, K, seed) for K in Ks]
+
+
+# Function to sweep K and evaluate every fit together; returns (rows, classes, tables)
+def kmeans_sweep(X, y, Ks, seed=42, workers=1, warm_start=False):
+    fits = sweep_fits(X, Ks, seed, workers, warm_start)
+    classes, tables = contingency_tables(y, [labels for _, labels, _, _, _ in fits], Ks)
+    rows = []
+    for (K, _, inertia, _, iterations), table in zip(fits, tables):
+        error = int(table.sum() - table.max(axis=1).sum())
+        rows.append({'K': K, 'inertia': inertia, 'error': error, 'error_rate': error / len(y),
+                     'empty_clusters': int((table.sum(axis=1) == 0).sum()), 'iterations': iterations})
+    return rows, classes, tables
+
+
+# Function to write one line per K to a tab-separated results table
+def write_results(rows, path):
+    with open(path, 'w') as f:
+        f.write('K\tinertia\terror\terror_rate\tempty_clusters\titerations\n')
+        for row in rows:
+            f.write(f"{row['K']}\t{row['inertia']:.6g}\t{row['error']}\t{row['error_rate']:.4f}\t"
+                    f"{row['empty_clusters']}\t{row['iterations']}\n")
+
+
+# Function to write every contingency table in long form: K, cluster, label, count (non-zero cells only)
+def write_tables(Ks, classes, tables, path):
+    with open(path, 'w') as f:
+        f.write('K\tcluster\tlabel\tcount\n')
+        for K, table in zip(Ks, tables):
+            for cluster, label in zip(*np.nonzero(table)):
+                f.write(f"{K}\t{cluster}\t{classes[label]}\t{table[cluster, label]}\n")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Fit k-means for a range of K and tabulate error and inertia.")
+    parser.add_argument('--data', default='MNIST_X_subset.npy')
+    parser.add_argument('--labels', default='MNIST_y_subset.npy')
+    parser.add_argument('--k', default='10-11', help="K values, e.g. 10, 2-20 or 5,10,15")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--warm-start', action='store_true',
+                        help="seed each K with the centroids of the previous K (runs serially)")
+    parser.add_argument('--output', default='kmeans_sweep.tsv')
+    parser.add_argument('--tables', default=None, help="optional path for the contingency tables")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    X = np.load(args.data, allow_pickle=True)
+    y = np.load(args.labels, allow_pickle=True)
+    Ks = parse_k_range(args.k)
+
+    rows, classes, tables = kmeans_sweep(X, y, Ks, args.seed, args.workers, args.warm_start)
+    write_results(rows, args.output)
+    if args.tables:
+        write_tables(Ks, classes, tables, args.tables)
+    for row in rows:
+        print(f"K={row['K']} Error={row['error']}")
+
+
+if __name__ == '__main__':
+    main()
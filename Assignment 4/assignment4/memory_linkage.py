@@ -0,0 +1,175 @@
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import squareform
+
+
+# Default memory budget for the distance matrix and the distance tiles, in bytes
+DEFAULT_MEMORY_BUDGET = 256 * 2 ** 20
+
+# Share of the budget given to the float32 matrix of cluster distances; the rest bounds each distance tile
+MATRIX_SHARE = 0.75
+
+# Float32 temporaries alive per tile element while a tile of distances is computed
+TILE_TEMPORARIES = 3
+
+
+# Function to find the largest number of clusters whose float32 distance matrix fits in the budget
+def max_clusters(memory_budget=DEFAULT_MEMORY_BUDGET):
+    return max(int((memory_budget * MATRIX_SHARE / 4) ** 0.5), 2)
+
+
+# Function to find how many rows of distances (each of length n) fit in the tile share of the budget
+def tile_rows(n, memory_budget=DEFAULT_MEMORY_BUDGET):
+    return max(int(memory_budget * (1 - MATRIX_SHARE) // (n * 4 * TILE_TEMPORARIES)), 1)
+
+
+# Function to compute float32 Euclidean distances between a block of rows and a set of points
+def distance_tile(block, block_norms, points, point_norms):
+    squared = block_norms[:, None] + point_norms[None, :] - 2 * (block @ points.T)
+    return np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+
+
+# Function to compute float32 Euclidean distances between two sets of rows of a float32 feature matrix
+def euclidean_distances(points_a, points_b):
+    return distance_tile(points_a, (points_a ** 2).sum(axis=1), points_b, (points_b ** 2).sum(axis=1))
+
+
+# Function to assign every point to the nearest of m randomly chosen anchor points, in tiles of rows
+# Returns group labels 0..g-1 (g <= m, as anchors that duplicate another point may end up empty).
+def anchor_groups(X, m, rng, memory_budget=DEFAULT_MEMORY_BUDGET, distances=euclidean_distances):
+    anchors = X[np.sort(rng.choice(len(X), size=m, replace=False))]
+    labels = np.empty(len(X), dtype=np.int64)
+    step = tile_rows(m, memory_budget)
+    for first in range(0, len(X), step):
+        labels[first:first + step] = distances(X[first:first + step], anchors).argmin(axis=1)
+    return np.unique(labels, return_inverse=True)[1]
+
+
+# Function to compute the mean distance between every pair of groups of a group-sorted matrix
+# Each tile holds the distances from a run of whole groups to every point; its columns and then its rows are summed
+# per group with reduceat, so only the (groups x groups) result and one tile are ever in memory.
+def mean_group_distances(X, starts, memory_budget=DEFAULT_MEMORY_BUDGET, distances=euclidean_distances):
+    n, m = len(X), len(starts)
+    bounds = np.append(starts, n)
+    sums = np.empty((m, m), dtype=np.float32)
+    step = tile_rows(n, memory_budget)
+    first_group = 0
+    while first_group < m:
+        last_group = max(np.searchsorted(bounds, bounds[first_group] + step, side='right') - 1, first_group + 1)
+        first, last = bounds[first_group], bounds[last_group]
+        tile = distances(X[first:last], X)
+        column_sums = np.add.reduceat(tile, starts, axis=1)
+        sums[first_group:last_group] = np.add.reduceat(column_sums, starts[first_group:last_group] - first, axis=0)
+        first_group = last_group
+    sizes = np.diff(bounds).astype(np.float32)
+    sums /= sizes[:, None]
+    sums /= sizes[None, :]
+    return sums
+
+
+# Function to run average linkage on a square float32 distance matrix with the nearest-neighbour chain algorithm
+# The matrix is updated in place with the Lance-Williams rule for average linkage, so memory stays at one float32
+# matrix. Merges come out in chain order as (slot a, slot b, height), with the merged cluster kept in slot b.
+def nn_chain_average(D, sizes):
+    m = len(D)
+    sizes = np.asarray(sizes, dtype=np.float64).copy()
+    np.fill_diagonal(D, np.inf)
+    active = np.ones(m, dtype=bool)
+    merges = []
+    chain = []
+    while len(merges) < m - 1:
+        if not chain:
+            chain.append(int(np.argmax(active)))
+        a = chain[-1]
+        b = int(np.argmin(D[a]))
+        if len(chain) > 1 and D[a, chain[-2]] <= D[a, b]:
+            b = chain[-2]  # Prefer the previous link on ties, so the chain never cycles
+        if len(chain) == 1 or b != chain[-2]:
+            chain.append(b)
+            continue
+        chain.pop()
+        chain.pop()
+        merges.append((a, b, float(D[a, b])))
+        merged = (sizes[a] * D[a] + sizes[b] * D[b]) / (sizes[a] + sizes[b])
+        D[b], D[:, b] = merged, merged
+        D[a], D[:, a] = np.inf, np.inf
+        D[b, b] = np.inf
+        sizes[b] += sizes[a]
+        active[a] = False
+    return merges
+
+
+# Function to turn merges given as (representative point, representative point, height) into a SciPy linkage matrix
+# Merges are sorted by height (stably) and relabelled with a union-find over the n points, as SciPy does for its own
+# nearest-neighbour chain, so the result is a valid, monotone Z with cluster n + i formed in row i.
+def merges_to_linkage(merges, n):
+    order = sorted(range(len(merges)), key=lambda i: merges[i][2])
+    parent = list(range(n))
+    node = list(range(n))
+    size = [1] * n
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    Z = np.empty((len(merges), 4))
+    for row, i in enumerate(order):
+        a, b, height = merges[i]
+        root_a, root_b = find(a), find(b)
+        Z[row] = [min(node[root_a], node[root_b]), max(node[root_a], node[root_b]), height,
+                  size[root_a] + size[root_b]]
+        parent[root_a] = root_b
+        node[root_b] = n + row
+        size[root_b] += size[root_a]
+    return Z
+
+
+# Function to compute average-linkage hierarchical clustering within a memory budget; returns a SciPy-compatible Z
+# When the float32 matrix of all n points fits in the budget, this is exact average linkage on distances computed in
+# float32 tiles. Otherwise the points are first split into as many groups as the budget allows (nearest of random
+# anchor points), each group is clustered on its own, and the groups are then joined by exact average linkage on
+# their mean pairwise distances; merge heights are raised where needed to keep Z monotone. Either way Z has one leaf
+# per input row, so fcluster, dendrogram and the clustering error work on it as on linkage(X, 'average').
+# `distances(rows_a, rows_b)` replaces the Euclidean distance between feature rows, so X can hold any per-point
+# representation (for example 2-bit packed genotypes with a popcount kernel).
+def memory_bounded_linkage(X, memory_budget=DEFAULT_MEMORY_BUDGET, seed=0, distances=None):
+    if distances is None:
+        X, distances = np.asarray(X, dtype=np.float32), euclidean_distances
+    n = len(X)
+    m = max_clusters(memory_budget)
+    if n <= m:
+        order = np.arange(n)
+        starts = np.arange(n)
+    else:
+        labels = anchor_groups(X, m, np.random.default_rng(seed), memory_budget, distances)
+        order = np.argsort(labels, kind='stable')
+        starts = np.flatnonzero(np.diff(np.concatenate([[-1], labels[order]])))
+    bounds = np.append(starts, n)
+
+    # Merges inside each group (SciPy on the small group, mapped back to point indices)
+    merges = []
+    representative = order[starts]
+    top_height = np.zeros(len(starts))
+    for group in np.flatnonzero(np.diff(bounds) > 1):
+        members = order[bounds[group]:bounds[group + 1]]
+        if distances is euclidean_distances:
+            local = linkage(X[members], method='average')
+        else:
+            points = X[members]
+            local = linkage(squareform(np.asarray(distances(points, points), dtype=np.float64), checks=False),
+                            method='average')
+        local_representative = list(members)
+        for left, right, height, _ in local:
+            merges.append((local_representative[int(left)], local_representative[int(right)], height))
+            local_representative.append(local_representative[int(left)])
+        top_height[group] = local[-1, 2]
+
+    # Merges between groups (average linkage on the groups' mean pairwise distances)
+    D = mean_group_distances(X[order], starts, memory_budget, distances)
+    for a, b, height in nn_chain_average(D, np.diff(bounds)):
+        height = max(height, top_height[a], top_height[b])
+        merges.append((representative[a], representative[b], height))
+        top_height[b] = height
+    return merges_to_linkage(merges, n)
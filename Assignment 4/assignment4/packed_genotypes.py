@@ -0,0 +1,207 @@
+# Kept identical in Assignment 4 and Assignment 5: each assignment directory is self-contained (its own
+# environment, scripts run from inside it), so the module is copied rather than imported. Change both copies.
+import argparse
+import json
+import numpy as np
+
+
+# Genotypes stored per uint64 word (2 bits each) and per byte
+GENOTYPES_PER_WORD = 32
+GENOTYPES_PER_BYTE = 4
+
+# 2-bit code of each genotype: a thermometer code, so the number of differing bits between two codes is |g1 - g2|
+CODES = np.array([0b00, 0b01, 0b11], dtype=np.uint8)
+
+# Genotypes of the four 2-bit slots of every byte value (a code's genotype is its number of set bits)
+DECODE = np.array([[bin((byte >> (2 * slot)) & 3).count('1') for slot in range(GENOTYPES_PER_BYTE)]
+                   for byte in range(256)], dtype=np.int8)
+
+# Low bit of every 2-bit slot
+LOW_BITS = np.uint64(0x5555555555555555)
+
+# Default size of the working set of one tile (decoded genotypes or XOR temporaries), in bytes
+DEFAULT_TILE_BYTES = 16 * 2 ** 20
+
+# Working bytes per genotype of a decoded tile: the looked-up int8 codes, the int8 result and its float32 copy
+DECODED_BYTES = 6
+
+# Rows a tile is given before it is widened over SNP words
+MIN_TILE_ROWS = 64
+
+
+# Function to choose (rows, words) of a tile whose decoded genotypes fit in tile_bytes
+# Tiles cover whole rows of words when the budget allows and are cut over SNP words as well otherwise, so the
+# working set never grows with the number of SNPs.
+def tile_shape(n_rows, n_words, tile_bytes=DEFAULT_TILE_BYTES):
+    word_bytes = GENOTYPES_PER_WORD * DECODED_BYTES
+    words = int(min(n_words, max(tile_bytes // (word_bytes * min(n_rows, MIN_TILE_ROWS)), 1)))
+    rows = int(min(n_rows, max(tile_bytes // (word_bytes * words), 1)))
+    return max(rows, 1), max(words, 1)
+
+
+# Function to yield (row slice, word slice, SNP slice) of every tile of a (samples x words) packed matrix
+def iter_tiles(n_rows, n_words, n_snps, tile_bytes=DEFAULT_TILE_BYTES):
+    rows, words = tile_shape(n_rows, n_words, tile_bytes)
+    for first_word in range(0, n_words, words):
+        last_word = min(first_word + words, n_words)
+        snps = slice(first_word * GENOTYPES_PER_WORD, min(last_word * GENOTYPES_PER_WORD, n_snps))
+        for first_row in range(0, n_rows, rows):
+            yield slice(first_row, min(first_row + rows, n_rows)), slice(first_word, last_word), snps
+
+
+# Function to decode a tile of packed words to int8 genotypes through the byte lookup table
+def decode_tile(words, n_snps):
+    data = np.ascontiguousarray(words, dtype='<u8').view(np.uint8)
+    return DECODE[data].reshape(len(words), -1)[:, :n_snps]
+
+
+# Function to pack a (samples x SNPs) matrix of 0/1/2 genotypes into (samples x words) uint64 words
+# Tiles of the input are encoded four genotypes per byte; `out` can be a memory-mapped array to write to.
+def pack_genotypes(X, out=None, tile_bytes=DEFAULT_TILE_BYTES):
+    n, n_snps = X.shape
+    n_words = -(-n_snps // GENOTYPES_PER_WORD)
+    words = np.zeros((n, n_words), dtype=np.uint64) if out is None else out
+    for rows, word_slice, snps in iter_tiles(n, n_words, n_snps, tile_bytes):
+        block = np.asarray(X[rows, snps])
+        genotypes = block.astype(np.int8)
+        if not np.array_equal(genotypes, block) or genotypes.min(initial=0) < 0 or genotypes.max(initial=0) > 2:
+            raise ValueError("Genotypes must be 0, 1 or 2")
+        width = (word_slice.stop - word_slice.start) * GENOTYPES_PER_WORD
+        codes = np.zeros((len(block), width), dtype=np.uint8)
+        codes[:, :block.shape[1]] = CODES[genotypes]
+        codes = codes.reshape(len(block), -1, GENOTYPES_PER_BYTE)
+        packed = codes[:, :, 0] | (codes[:, :, 1] << 2) | (codes[:, :, 2] << 4) | (codes[:, :, 3] << 6)
+        words[rows, word_slice] = np.ascontiguousarray(packed).view('<u8')
+    return words
+
+
+# Function to decode packed words back to a (samples x SNPs) genotype matrix
+def unpack_genotypes(words, n_snps, dtype=np.float32):
+    return decode_tile(words, n_snps).astype(dtype)
+
+
+# Function to write packed genotypes to a .npy file, with the number of SNPs in a .json file next to it
+# The words go straight into a memory-mapped output file, so only one tile is ever in memory.
+def write_packed(X, path, tile_bytes=DEFAULT_TILE_BYTES):
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint64,
+                                    shape=(X.shape[0], -(-X.shape[1] // GENOTYPES_PER_WORD)))
+    pack_genotypes(X, out, tile_bytes)
+    out.flush()
+    with open(path + '.json', 'w') as f:
+        json.dump({'n_snps': int(X.shape[1])}, f)
+
+
+# Function to open packed genotypes as a read-only memory map; returns (words, number of SNPs)
+def read_packed(path):
+    with open(path + '.json') as f:
+        n_snps = json.load(f)['n_snps']
+    return np.load(path, mmap_mode='r'), n_snps
+
+
+# Function to compute distances between two sets of packed samples with popcounts, in tiles of rows
+# XOR of two thermometer codes has one bit set where genotypes differ by 1 and both bits set where they differ by 2,
+# so the IBS distance (sum of |g1 - g2|) is popcount(x) and the squared Euclidean distance adds 2 popcount(x & x >> 1
+# & low bits). metric is 'ibs' (integer counts) or 'euclidean' (equal to Euclidean distance on the 0/1/2 matrix).
+# Each tile is converted on the way out, so the only full-size array is the result in `dtype` (default int64 for
+# 'ibs' and float64 for 'euclidean').
+def genotype_distances(words_a, words_b=None, metric='euclidean', tile_bytes=DEFAULT_TILE_BYTES, dtype=None):
+    words_b = words_a if words_b is None else words_b
+    step = max(int((tile_bytes / (3 * 8 * max(words_a.shape[1], 1))) ** 0.5), 1)  # XOR plus two temporaries
+    if dtype is None:
+        dtype = np.float64 if metric == 'euclidean' else np.int64
+    distances = np.empty((len(words_a), len(words_b)), dtype=dtype)
+    for first_a in range(0, len(words_a), step):
+        block_a = np.asarray(words_a[first_a:first_a + step])[:, None, :]
+        for first_b in range(0, len(words_b), step):
+            x = block_a ^ np.asarray(words_b[first_b:first_b + step])[None, :, :]
+            tile = np.bitwise_count(x).sum(axis=2, dtype=np.int64)
+            if metric == 'euclidean':
+                tile += 2 * np.bitwise_count(x & (x >> np.uint64(1)) & LOW_BITS).sum(axis=2, dtype=np.int64)
+                tile = np.sqrt(tile)
+            distances[first_a:first_a + step, first_b:first_b + step] = tile
+    return distances
+
+
+# Function to compute the condensed distance vector of packed samples, as scipy.spatial.distance.pdist returns it
+def condensed_genotype_distances(words, metric='euclidean', block_rows=256):
+    n = len(words)
+    condensed = np.empty(n * (n - 1) // 2)
+    position = 0
+    for first in range(0, n, block_rows):
+        block = genotype_distances(words[first:first + block_rows], words[first:], metric)
+        for i in range(len(block)):
+            condensed[position:position + len(block[i]) - i - 1] = block[i, i + 1:]
+            position += len(block[i]) - i - 1
+    return condensed
+
+
+# Function to compute per-SNP means and scales of packed genotypes in one tiled pass
+# With standardize=False the scale is 1, so the result matches PCA on the raw matrix (centring only); otherwise each
+# SNP is scaled by sqrt(2 p (1 - p)), p its allele frequency, the usual standardization for genotype PCA.
+def genotype_moments(words, n_snps, standardize=False, tile_bytes=DEFAULT_TILE_BYTES):
+    sums = np.zeros(n_snps, dtype=np.int64)
+    for rows, word_slice, snps in iter_tiles(len(words), words.shape[1], n_snps, tile_bytes):
+        sums[snps] += decode_tile(words[rows, word_slice], snps.stop - snps.start).sum(axis=0, dtype=np.int64)
+    means = sums / len(words)
+    if not standardize:
+        return means, np.ones(n_snps)
+    frequency = means / 2
+    scales = np.sqrt(2 * frequency * (1 - frequency))
+    scales[scales == 0] = 1  # Monomorphic SNPs stay at zero after centring
+    return means, scales
+
+
+# Function to multiply the centred (and optionally scaled) genotype matrix, or its transpose, by a dense matrix
+# Tiles are decoded to float32 one at a time, so the float matrix is never held in full; products accumulate in
+# float64.
+def standardized_product(words, n_snps, means, scales, M, transpose=False, tile_bytes=DEFAULT_TILE_BYTES):
+    result = np.zeros((n_snps if transpose else len(words), M.shape[1]))
+    M = M.astype(np.float32)
+    means, scales = means.astype(np.float32), scales.astype(np.float32)
+    for rows, word_slice, snps in iter_tiles(len(words), words.shape[1], n_snps, tile_bytes):
+        tile = decode_tile(words[rows, word_slice], snps.stop - snps.start).astype(np.float32)
+        tile -= means[snps]
+        tile /= scales[snps]
+        if transpose:
+            result[snps] += tile.T @ M[rows]
+        else:
+            result[rows] += tile @ M[snps]
+    return result
+
+
+# Function to compute the leading principal components of packed genotypes by tiled randomized SVD
+# Each pass decodes the data one tile at a time, so memory is O((samples + SNPs) x components) plus one tile of
+# tile_bytes. Signs follow sklearn's PCA (largest loading of each component positive). Returns (scores, components,
+# explained variance).
+def packed_pca(words, n_snps, n_components=2, standardize=False, oversample=10, power_iterations=4,
+               tile_bytes=DEFAULT_TILE_BYTES, seed=42):
+    means, scales = genotype_moments(words, n_snps, standardize, tile_bytes)
+    rank = min(n_components + oversample, len(words), n_snps)
+    rng = np.random.default_rng(seed)
+    Q, _ = np.linalg.qr(standardized_product(words, n_snps, means, scales, rng.standard_normal((n_snps, rank)),
+                                             tile_bytes=tile_bytes))
+    for _ in range(power_iterations):
+        P, _ = np.linalg.qr(standardized_product(words, n_snps, means, scales, Q, True, tile_bytes))
+        Q, _ = np.linalg.qr(standardized_product(words, n_snps, means, scales, P, tile_bytes=tile_bytes))
+    B = standardized_product(words, n_snps, means, scales, Q, True, tile_bytes).T
+    U, S, Vt = np.linalg.svd(B, full_matrices=False)
+    U, S, Vt = Q @ U[:, :n_components], S[:n_components], Vt[:n_components]
+    signs = np.sign(Vt[np.arange(n_components), np.abs(Vt).argmax(axis=1)])
+    return U * S * signs, Vt * signs[:, None], S ** 2 / (len(words) - 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a 0/1/2 genotype .npy to 2-bit packed words.")
+    parser.add_argument('input', help="genotype matrix, e.g. dogs_X.npy")
+    parser.add_argument('output', help="packed .npy (the SNP count goes to <output>.json)")
+    parser.add_argument('--tile-mb', type=int, default=DEFAULT_TILE_BYTES // 2 ** 20)
+    args = parser.parse_args(argv)
+    try:
+        X = np.load(args.input, mmap_mode='r')
+    except ValueError:  # Object arrays cannot be memory-mapped
+        X = np.load(args.input, allow_pickle=True)
+    write_packed(X, args.output, args.tile_mb * 2 ** 20)
+
+
+if __name__ == '__main__':
+    main()
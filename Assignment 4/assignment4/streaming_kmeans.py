@@ -0,0 +1,93 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.cluster import MiniBatchKMeans, kmeans_plusplus
+
+
+# Default number of rows per mini-batch
+DEFAULT_BATCH_SIZE = 4096
+
+# Rows per contiguous read when a mini-batch is assembled from random parts of the file
+CHUNK_ROWS = 64
+
+# Rows sampled from across the file to seed the centroids with k-means++
+INIT_SAMPLE = 8192
+
+
+# Function to open a feature matrix without loading it: a read-only memory map of a .npy file
+def open_features(path):
+    return np.load(path, mmap_mode='r')
+
+
+# Function to yield (first row, float32 batch) pairs of a (possibly memory-mapped) matrix in file order
+def iter_batches(X, batch_size=DEFAULT_BATCH_SIZE):
+    for first in range(0, X.shape[0], batch_size):
+        yield first, np.asarray(X[first:first + batch_size], dtype=np.float32)
+
+
+# Function to yield float32 mini-batches of CHUNK_ROWS-row pieces taken from random places in the file
+# Rows are often stored grouped by label, so a contiguous batch would show the model a single class at a time;
+# gathering short contiguous pieces in file order keeps the reads mostly sequential while mixing the classes.
+def iter_shuffled_batches(X, rng, batch_size=DEFAULT_BATCH_SIZE):
+    chunks = rng.permutation(-(-X.shape[0] // CHUNK_ROWS))
+    per_batch = max(batch_size // CHUNK_ROWS, 1)
+    for first in range(0, len(chunks), per_batch):
+        rows = np.concatenate([np.arange(chunk * CHUNK_ROWS, min((chunk + 1) * CHUNK_ROWS, X.shape[0]))
+                               for chunk in np.sort(chunks[first:first + per_batch])])
+        yield np.asarray(X[rows], dtype=np.float32)
+
+
+# Function to choose starting centroids with k-means++ on a random sample of rows from across the file
+def initial_centers(X, K, rng, sample_size=INIT_SAMPLE):
+    rows = np.sort(rng.choice(X.shape[0], size=min(sample_size, X.shape[0]), replace=False))
+    centers, _ = kmeans_plusplus(np.asarray(X[rows], dtype=np.float32), K, random_state=int(rng.integers(2 ** 31)))
+    return centers
+
+
+# Function to fit one mini-batch k-means restart by streaming float32 batches from a memory-mapped .npy
+# Every epoch visits all rows once in a new random order; only one batch is in memory at a time.
+def fit_restart(path, K, seed, batch_size=DEFAULT_BATCH_SIZE, epochs=3):
+    X = open_features(path)
+    rng = np.random.default_rng(seed)
+    model = MiniBatchKMeans(n_clusters=K, init=initial_centers(X, K, rng), random_state=seed,
+                            batch_size=batch_size, n_init=1)
+    for _ in range(epochs):
+        for batch in iter_shuffled_batches(X, rng, batch_size):
+            if len(batch) >= K:  # partial_fit needs at least K rows (a short last batch can be skipped)
+                model.partial_fit(batch)
+    return model
+
+
+# Function to label every row with its nearest centroid in batches; returns (labels, inertia)
+def predict_streaming(model, X, batch_size=DEFAULT_BATCH_SIZE):
+    labels = np.empty(X.shape[0], dtype=np.int32)
+    inertia = 0.0
+    centers = model.cluster_centers_.astype(np.float32)
+    center_norms = (centers ** 2).sum(axis=1)
+    for first, batch in iter_batches(X, batch_size):
+        distances = (batch ** 2).sum(axis=1)[:, None] - 2 * batch @ centers.T + center_norms
+        labels[first:first + len(batch)] = distances.argmin(axis=1)
+        inertia += float(np.maximum(distances.min(axis=1), 0).sum())
+    return labels, inertia
+
+
+# Function to fit and score one restart (used as a process-pool task); returns (inertia, model)
+def run_restart(task):
+    path, K, seed, batch_size, epochs = task
+    model = fit_restart(path, K, seed, batch_size, epochs)
+    _, inertia = predict_streaming(model, open_features(path), batch_size)
+    return inertia, model
+
+
+# Function to run mini-batch k-means with several restarts, optionally in parallel, and keep the best one
+# Restart i uses seed + i, so the result does not depend on the number of workers. Inertia is recomputed over the
+# whole data set for every restart before the lowest one is chosen. Returns (model, labels, inertia).
+def streaming_kmeans(path, K, restarts=4, workers=1, batch_size=DEFAULT_BATCH_SIZE, epochs=3, seed=42):
+    tasks = [(path, K, seed + i, batch_size, epochs) for i in range(restarts)]
+    if workers > 1 and restarts > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_restart, tasks))
+    else:
+        results = [run_restart(task) for task in tasks]
+    inertia, model = min(results, key=lambda result: result[0])
+    labels, _ = predict_streaming(model, open_features(path), batch_size)
+    return model, labels, inertia
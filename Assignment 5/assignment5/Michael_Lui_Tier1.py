@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 from sklearn.decomposition import PCA
 from sklearn.manifold import MDS
 from mpl_toolkits.mplot3d import Axes3D
+import argparse
+from packed_genotypes import read_packed, packed_pca
 
 # Part 1: PCA on MNIST dataset
 def pca_mnist():
@@ -40,9 +42,9 @@ def pca_mnist():
     plt.imsave("MNIST_reconstructed_1_from_coord.png", point_reconstructed.reshape(28, 28), cmap='gray')  # Save the reconstructed image
 
 # Part 2: PCA on Dogs SNP dataset
-def pca_dogs_snp():
-    # Load Dogs SNP data
-    dogs_X = np.load("dogs_X.npy", allow_pickle=True)
+# With packed_path, the 2-bit packed genotypes are decoded block by block (see packed_genotypes.py), so the panel
+# never has to fit in memory as a float matrix; standardize also scales each SNP by sqrt(2p(1-p)).
+def pca_dogs_snp(packed_path=None, standardize=False):
     dogs_clades = np.load("dogs_clades.npy", allow_pickle=True)
     
     # Convert clade labels to numeric values
@@ -51,8 +53,13 @@ def pca_dogs_snp():
     numeric_clades = np.array([clade_to_numeric[clade] for clade in dogs_clades])
     
     # Perform PCA to reduce to 2D
-    pca = PCA(n_components=2, random_state=42)
-    dogs_X_pca = pca.fit_transform(dogs_X)
+    if packed_path:
+        words, n_snps = read_packed(packed_path)
+        dogs_X_pca, _, _ = packed_pca(words, n_snps, n_components=2, standardize=standardize)
+    else:
+        dogs_X = np.load("dogs_X.npy", allow_pickle=True)
+        pca = PCA(n_components=2, random_state=42)
+        dogs_X_pca = pca.fit_transform(dogs_X)
     
     # Save 2D PCA scatter plot with color-coded clades
     plt.figure(figsize=(10, 8))
@@ -111,8 +118,15 @@ def mds_molecule():
     plt.savefig("Molecule_MDS_3D.png")
     plt.close()
 
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="PCA of MNIST and Dogs SNP data, MDS of a molecule.")
+    parser.add_argument('--packed-dogs', default=None, help="packed genotypes from packed_genotypes.py")
+    parser.add_argument('--standardize', action='store_true', help="scale SNPs (packed mode only)")
+    return parser.parse_args(argv)
+
 # Run all parts
 if __name__ == "__main__":
+    args = parse_arguments()
     pca_mnist()
-    pca_dogs_snp()
+    pca_dogs_snp(args.packed_dogs, args.standardize)
     mds_molecule()